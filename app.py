@@ -1,17 +1,79 @@
 import random
 import os
-import requests
-from flask import Flask, render_template, abort, request
-from quote_engine.ingestor import Ingestor
+import time
+import hmac
+import cProfile
+from flask import Flask, render_template, abort, request, url_for, Response, jsonify, send_file, g
 from meme_engine.meme_generator import MemeGenerator
+from meme_engine.render_cache import RenderCache
+from meme_engine.image_fetcher import ImageFetcher
+from meme_engine.meme_pool import MemePool
+from meme_engine.render_queue import RenderQueue, SQLiteJobStore, QueueFullError, DONE, FAILED
+from meme_engine.caption_layout import layout_caption
+from meme_engine.font_registry import FontRegistry
+from meme_engine.output_store import OutputStore, unique_file_name
+from metrics import registry
 from quote_engine import QuoteModel
-from time_utils import get_current_time
+from corpus_reloader import CorpusReloader
 
 # create a Flash application instance
 app = Flask(__name__)
 
+# all the memes are sharded under ./static and deleted by a background janitor beyond
+# a file count, a disk quota and an age; the index is shared by the workers of the app,
+# so the limits hold for all of them, and kept out of ./static which is served publicly
+output_store = OutputStore('./static', max_files=10000, max_bytes=256 * 1024 * 1024, max_age=24 * 3600,
+                           index_path='./.output_index')
+output_store.start()
+# a cache of the rendered memes, so popular image and quote pairs are only rendered once;
+# its memes are kept in the shards of the store, which bounds them with the other memes
+render_cache = RenderCache(output_store, max_bytes=None)
 # a meme instance
-meme = MemeGenerator('./static')
+meme = MemeGenerator(output_store, render_cache=render_cache)
+# a fetcher of the remote images, sharing a pool of connections between requests
+fetcher = ImageFetcher()
+# the longest quote body and author accepted from the users, the layout of a caption grows with its length
+MAX_BODY_LENGTH = 300
+MAX_AUTHOR_LENGTH = 100
+
+
+def caption_error(body, author):
+    """Check the length of a quote given by a user.
+
+        Returns:
+            the error message, or None if the quote can be rendered.
+    """
+    if body and len(body) > MAX_BODY_LENGTH:
+        return f"The quote body is longer than {MAX_BODY_LENGTH} characters"
+    if author and len(author) > MAX_AUTHOR_LENGTH:
+        return f"The quote author is longer than {MAX_AUTHOR_LENGTH} characters"
+    return None
+
+
+def render_job(body, author, img_url=None, img=None):
+    """Render the meme of a /create job in a worker of the render queue.
+
+        Arguments:
+            body {str} -- the quote body.
+            author {str} -- the author of the quote.
+            img_url {str} -- the URL of the image to download, if any.
+            img {str} -- the file location of a local image, used without an URL.
+
+        Returns:
+            the manifest of the variants of the meme.
+    """
+    if img_url:
+        img = fetcher.fetch_image(img_url)
+    variants = meme.render_variants(img, body, author)
+    if not variants:
+        raise FileNotFoundError(f"The image {img} is not found")
+    return variants
+
+
+# the queue of the /create renders, the jobs survive a restart when MEME_JOBS_DB names a SQLite file
+jobs_db = os.environ.get('MEME_JOBS_DB')
+render_queue = RenderQueue(render_job, max_workers=4, max_pending=32,
+                           store=SQLiteJobStore(jobs_db) if jobs_db else None)
 
 def setup():
     """Load all necessary resources for the application."""
@@ -21,29 +83,152 @@ def setup():
                    './_data/DogQuotes/DogQuotesPDF.pdf',
                    './_data/DogQuotes/DogQuotesCSV.csv']
 
-    """Use the Ingestor class to parse all files in the quote_files variable
-    """
-    # a list to store all parsed quotes
-    quotes = []
-    # parse then store each quote
-    for quote_file in quote_files:
-        quotes.extend(Ingestor.parse(quote_file))
-
     images_path = "./_data/photos/dog/"
-    """Use the pythons standard library os class to find all
-    images within the images_path directory.
+
+    """Use the CorpusReloader class to parse all files in the quote_files variable
+    and find all images within the images_path directory, then to reload them
+    in the background whenever they change.
     """
-    # a list of all images
-    imgs = []
-    # traverse a directory tree and access all the files and directories (include subdir) within it
-    for root, dirs, files in os.walk(images_path):
-        # store the image with the full path of that image file
-        imgs = [os.path.join(root, name) for name in files]
+    reloader = CorpusReloader(quote_files, images_path, image_index='./.image_catalog.json')
+    reloader.reload()
+    reloader.start()
+
+    return reloader
+
+
+# the current quotes and images are in corpus.snapshot
+corpus = setup()
+
+
+def render_random_meme():
+    """Render the variants of a meme from a random image and a random quote."""
+    quotes, imgs = corpus.snapshot
+    quote = quotes.sample()
+    if not imgs or quote is None:
+        return None
+    return meme.render_variants(random.choice(imgs), quote.quote_body, quote.author)
+
+
+# the random memes of / rendered ahead of time, MEME_POOL_SIZE=0 disables the pool
+meme_pool = MemePool(render_random_meme, size=int(os.environ.get('MEME_POOL_SIZE', 8)))
+if meme_pool.size > 0:
+    meme_pool.start()
+
+
+def cache_metrics():
+    """Read the hit counts of the caches, the length of the render queue and the size of the output store for /metrics."""
+    counts = {name: (cache.hits, cache.misses) for name, cache in
+              (('image', meme.image_cache), ('overlay', meme.overlay_cache),
+               ('render', render_cache), ('meme_pool', meme_pool)) if cache is not None}
+    for name, function in (('layout', layout_caption), ('text_size', FontRegistry.text_size)):
+        info = function.cache_info()
+        counts[name] = (info.hits, info.misses)
+
+    yield ('meme_cache_hits_total', 'counter', 'The lookups served by each cache',
+           [({'cache': name}, hits) for name, (hits, _) in counts.items()])
+    yield ('meme_cache_misses_total', 'counter', 'The lookups missed by each cache',
+           [({'cache': name}, misses) for name, (_, misses) in counts.items()])
+    yield ('meme_cache_hit_ratio', 'gauge', 'The part of the lookups served by each cache',
+           [({'cache': name}, hits / (hits + misses))
+            for name, (hits, misses) in counts.items() if hits + misses])
+    yield ('meme_render_queue_pending', 'gauge', 'The render jobs waiting for a worker',
+           [({}, render_queue.pending())])
+    yield ('meme_output_files', 'gauge', 'The memes kept by the output store', [({}, len(output_store))])
+    yield ('meme_output_bytes', 'gauge', 'The disk used by the memes of the output store',
+           [({}, output_store.current_bytes)])
+    yield ('meme_output_evictions_total', 'counter', 'The memes deleted by the janitor of the output store',
+           [({}, output_store.evictions)])
+
+
+registry.add_collector(cache_metrics)
+# the time and the status of the requests by route
+request_seconds = registry.histogram('http_request_seconds', 'The seconds spent serving a request',
+                                     ('endpoint',))
+requests_total = registry.counter('http_requests_total', 'The requests served', ('endpoint', 'status'))
+
+# the part of the requests profiled with cProfile, none by default; a request with
+# ?profile=<MEME_PROFILE_SECRET> is profiled as well, but only when the secret is set
+profile_rate = float(os.environ.get('MEME_PROFILE_RATE', 0))
+profile_secret = os.environ.get('MEME_PROFILE_SECRET')
+# the profiles are saved into MEME_PROFILE_DIR, which keeps the latest MEME_PROFILE_MAX_FILES of them
+profile_dir = os.environ.get('MEME_PROFILE_DIR', './profiles')
+profile_max_files = int(os.environ.get('MEME_PROFILE_MAX_FILES', 100))
+
+
+def profile_requested():
+    """Check whether the request asks to be profiled with the secret, compared in constant time."""
+    token = request.args.get('profile')
+    return bool(profile_secret and token) and hmac.compare_digest(token.encode('utf-8'),
+                                                                   profile_secret.encode('utf-8'))
+
+
+def prune_profiles():
+    """Delete the oldest profiles beyond MEME_PROFILE_MAX_FILES."""
+    with os.scandir(profile_dir) as entries:
+        profiles = [(entry.stat().st_mtime_ns, entry.path) for entry in entries
+                    if entry.is_file() and entry.name.endswith('.prof')]
+    profiles.sort()
+    for _, path in profiles[:max(0, len(profiles) - profile_max_files)]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # deleted by another worker meanwhile
+            pass
+
+
+@app.before_request
+def start_request():
+    """Start timing the request, and profiling it if it is sampled."""
+    g.started = time.perf_counter()
+    g.profiler = None
+    if (profile_rate > 0 and random.random() < profile_rate) or profile_requested():
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            g.profiler = profiler
+        except ValueError:
+            # another request is being profiled and the interpreter allows a single profiler
+            pass
+
+
+@app.after_request
+def finish_request(response):
+    """Record the time of the request, and save its profile if it was profiled."""
+    endpoint = request.endpoint or 'unknown'
+    request_seconds.observe(time.perf_counter() - g.started, endpoint)
+    requests_total.inc(endpoint, str(response.status_code))
+    if g.get('profiler') is not None:
+        g.profiler.disable()
+        try:
+            os.makedirs(profile_dir, exist_ok=True)
+            profile_path = os.path.join(profile_dir, unique_file_name(f"-{endpoint}.prof"))
+            # e.g. python -m pstats ./profiles/<file>.prof
+            g.profiler.dump_stats(profile_path)
+            prune_profiles()
+            # the name of the file only, the layout of the server is not disclosed
+            response.headers['X-Profile'] = os.path.basename(profile_path)
+        except OSError as e:
+            print(f"There is error \"{str(e)}\" when saving the profile of the request")
+    return response
 
-    return quotes, imgs
 
+def static_url(path):
+    """Return the absolute URL of a file written under ./static, which works from any page, e.g. /jobs/<job_id>."""
+    return url_for('static', filename=os.path.relpath(path, './static').replace(os.sep, '/'))
 
-quotes, imgs = setup()
+
+def render_meme_page(variants):
+    """Render the page of a meme, letting the browser pick the best of its variants."""
+    if not variants:
+        return render_template('meme.html', path=None)
+    # the "url width" candidates of every format
+    srcsets = {}
+    for variant in variants:
+        srcsets.setdefault(variant['format'], []).append(f"{static_url(variant['path'])} {variant['width']}w")
+    # the first variant is the default image of the browsers without srcset
+    return render_template('meme.html', path=static_url(variants[0]['path']),
+                           srcset=', '.join(srcsets.get('JPEG', [])),
+                           webp_srcset=', '.join(srcsets.get('WEBP', [])))
 
 
 @app.route('/')
@@ -51,17 +236,100 @@ def meme_rand():
     """Generate a random meme.
     when a user visits the root URL of the application, 
     this function is executed
+    The quote can be restricted to an author with ?author= and
+    to the quotes containing some keywords with ?q=
     """
+    author = request.args.get('author')
+    query = request.args.get('q')
+    stream = request.args.get('stream')
+    # an unfiltered meme is taken from the pool of pre-rendered memes when it is not empty
+    if not author and not query and not stream:
+        variants = meme_pool.take()
+        if variants:
+            return render_meme_page(variants)
+
+    # the snapshot of the corpus is consistent even if a reload swaps in a new one meanwhile
+    quotes, imgs = corpus.snapshot
     # Use the random python standard library class to:
     # 1. select a random image from imgs array
     img = random.choice(imgs)
-    # 2. select a random quote from the quotes array
-    quote = random.choice(quotes)
-    # generate the meme from given image and quote
-    path = meme.make_meme(img, quote.quote_body, quote.author)
+    # 2. select a random quote from the quotes store, using its indexes for the filters
+    quote = quotes.sample(author=author, query=query)
+    if quote is None:
+        abort(404)
+    # with ?stream=1 the image is rendered in memory by /meme.jpg instead of written to disk
+    if stream:
+        path = url_for('meme_image', img=image_name(img),
+                       body=quote.quote_body, author=quote.author)
+        return render_template('meme.html', path=path)
+    # generate the variants of the meme from given image and quote
+    variants = meme.render_variants(img, quote.quote_body, quote.author)
+
+
+    return render_meme_page(variants)
+
+
+def image_name(img_path):
+    """Return the path of an image relative to the images directory, as used in the URLs."""
+    return os.path.relpath(img_path, corpus.catalog.root).replace(os.sep, '/')
+
+
+def find_image(name):
+    """Look up an image of the catalog by the name given by image_name().
+
+        Returns:
+            the path of the image, or None if it is not in the catalog.
+    """
+    # the catalog is keyed by the paths it found, which are joined to its root the same way
+    info = corpus.catalog.get(os.path.join(corpus.catalog.root, *name.split('/')))
+    return info.path if info is not None else None
+
+
+@app.route('/meme.jpg')
+def meme_image():
+    """Stream a meme rendered in memory.
+    The image is chosen by its path relative to the images directory with the 'img' parameter and the quote
+    with the 'body' and 'author' parameters, each of them is random when not given.
+    """
+    # a consistent snapshot of the quotes and images
+    quotes, imgs = corpus.snapshot
+    img_name = request.args.get('img')
+    quote_body = request.args.get('body')
+    quote_author = request.args.get('author')
+    error = caption_error(quote_body, quote_author)
+    if error:
+        abort(400, description=error)
+    # the same parameters always give the same meme, so the browser may cache it
+    is_random = not img_name or not quote_body or not quote_author
+
+    if img_name:
+        # only the images of the catalog can be used, never an arbitrary path
+        img = find_image(img_name)
+        if img is None:
+            abort(404)
+    else:
+        img = random.choice(imgs)
+    if not quote_body or not quote_author:
+        quote = random.choice(quotes)
+        quote_body = quote.quote_body
+        quote_author = quote.author
 
+    # the etag changes with the inputs and with the content of the source image
+    etag = meme.cache_key(img, quote_body, quote_author)
+    if not is_random and request.if_none_match.contains_weak(etag):
+        # the browser already has this meme, skip rendering
+        response = Response(status=304)
+    else:
+        buffer = meme.make_meme_buffer(img, quote_body, quote_author)
+        response = Response(buffer.getvalue(), mimetype='image/jpeg')
 
-    return render_template('meme.html', path=path)
+    if is_random:
+        response.cache_control.no_store = True
+    else:
+        response.set_etag(etag, weak=True)
+        response.cache_control.public = True
+        response.cache_control.max_age = 24 * 3600
+    return response
 
 
 @app.route('/create', methods=['GET'])
@@ -75,36 +343,89 @@ def meme_form():
 @app.route('/create', methods=['POST'])
 def meme_post():
     """Create a user defined meme.
-    The route decorator maps the URL '/create' with the HTTP method GET 
-    to the meme_form() function"""
-    # 1. Use requests module to save the image from the image_url
-    #    form param to a temp local file.
-    img_url = request.form.get('img_url')
-    # 2. Use the meme object to generate a meme using this temp
-    #    file and the body and author form paramaters.
-    if img_url:
-        # send a get request to the image url
-        response = request.get(img_url)
-        img = get_current_time + '.jpg'
-        # check if the request was successful (status code 200)
-        if response.status_code == 200:
-            # open a temp file to save the image
-            with open(img, "wb") as file:
-                file.write(response.content)
-    else:
-        img = random.choice(imgs)
-    
+    The meme is rendered in the background, the response is the id of the
+    render job and the page of /jobs/<job_id> shows the meme once it is done.
+    """
+    # a consistent snapshot of the quotes and images
+    quotes, imgs = corpus.snapshot
+    # 1. The image_url form param is downloaded by a worker of the queue, within
+    #    a timeout and a size limit, without a random image in that case.
+    params = {'img_url': request.form.get('img_url') or None}
+    if not params['img_url']:
+        params['img'] = random.choice(imgs)
+
     quote_body = request.form.get('body')
     quote_author = request.form.get('author')
+    error = caption_error(quote_body, quote_author)
+    if error:
+        return render_template('meme_form.html', error=error), 400
     if not quote_body or not quote_author:
         quote = random.choice(quotes)
         quote_body = quote.quote_body
         quote_author = quote.author
+    params['body'] = quote_body
+    params['author'] = quote_author
+
+    # 2. Queue the meme, an identical meme in flight is only rendered once.
+    try:
+        job_id = render_queue.submit(params)
+    except QueueFullError as e:
+        response = Response(render_template('meme_form.html', error=str(e)), status=429)
+        response.headers['Retry-After'] = '5'
+        return response
+
+    location = url_for('job_status', job_id=job_id)
+    if request.accept_mimetypes.best == 'application/json':
+        response = jsonify(id=job_id, status_url=location,
+                           result_url=url_for('job_result', job_id=job_id))
+    else:
+        response = Response(render_template('meme_job.html', job_id=job_id, status='queued'))
+    response.status_code = 202
+    response.headers['Location'] = location
+    return response
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Show the state of a render job, and the meme once it is done."""
+    job = render_queue.get(job_id)
+    if job is None:
+        abort(404)
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(job.to_dict())
+    if job.status == DONE:
+        return render_meme_page(job.result)
+    if job.status == FAILED:
+        return render_template('meme_form.html', error=job.error), 422
+    # the page refreshes itself until the job is finished
+    return render_template('meme_job.html', job_id=job_id, status=job.status), 202
+
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    """Return the image of a finished render job, or 202 while it is not finished."""
+    job = render_queue.get(job_id)
+    if job is None:
+        abort(404)
+    if job.status == FAILED:
+        return jsonify(job.to_dict()), 422
+    if job.status != DONE:
+        response = jsonify(job.to_dict())
+        response.status_code = 202
+        response.headers['Retry-After'] = '1'
+        return response
+    # the first variant is the default image, like in the meme page
+    path = job.result[0]['path']
+    if not os.path.exists(path):
+        # the rendered meme was evicted from the cache meanwhile
+        abort(410)
+    return send_file(os.path.abspath(path))
 
-    # 3. Make meme.
-    path = meme.make_meme(img, quote_body, quote_author)
 
-    return render_template('meme.html', path=path)
+@app.route('/metrics')
+def metrics_page():
+    """Export the timings of the stages, the request counts and the cache hit rates for Prometheus."""
+    return Response(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 if __name__ == "__main__":
     app.run()
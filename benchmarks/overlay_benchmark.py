@@ -0,0 +1,48 @@
+"""Measure the time saved per meme by compositing cached caption overlays.
+
+Run from the root of the project:
+    python -m benchmarks.overlay_benchmark --iterations 500
+"""
+import time
+import argparse
+from meme_engine.meme_generator import MemeGenerator
+from meme_engine.caption_overlay import OverlayCache
+
+# a few image and quote pairs, repeated like the traffic of the app
+PAIRS = [('./_data/photos/dog/xander_1.jpg', 'To bork or not to bork', 'Bork'),
+         ('./_data/photos/dog/xander_2.jpg', 'He who smelt it...', 'Stinky'),
+         ('./_data/photos/dog/xander_3.jpg', 'Chase the mailman', 'Skittle'),
+         ('./_data/photos/dog/xander_4.jpg', 'When in doubt, go shoe-shopping', 'Mr. Paws')]
+
+
+def time_renders(meme: MemeGenerator, iterations: int) -> float:
+    """Render the pairs in turn and return the mean seconds per meme."""
+    # warm the image, font and layout caches so that only the captions differ
+    for img_path, text, author in PAIRS:
+        meme.render(img_path, text, author)
+    started = time.perf_counter()
+    for i in range(iterations):
+        img_path, text, author = PAIRS[i % len(PAIRS)]
+        meme.render(img_path, text, author)
+    return (time.perf_counter() - started) / iterations
+
+
+def main():
+    """Compare drawing the captions on every meme with compositing the cached overlays."""
+    parser = argparse.ArgumentParser(description='Benchmark the cached caption overlays')
+    parser.add_argument('--iterations', type=int, default=500,
+                        help='The number of memes rendered in each mode')
+    args = parser.parse_args()
+
+    drawn = time_renders(MemeGenerator('./output', overlay_cache=None), args.iterations)
+    composited = time_renders(MemeGenerator('./output', overlay_cache=OverlayCache()),
+                              args.iterations)
+
+    print(f"draw the caption on every meme:   {drawn * 1000:.3f} ms per meme")
+    print(f"composite the cached caption:     {composited * 1000:.3f} ms per meme")
+    print(f"saved per meme:                   {(drawn - composited) * 1000:.3f} ms "
+          f"({(1 - composited / drawn) * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
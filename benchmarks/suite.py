@@ -0,0 +1,223 @@
+"""Benchmark the ingestion and rendering hot paths, and report the results as JSON.
+
+Every benchmark runs in a fresh process, so that its peak RSS is its own.
+The app benchmark loads the real corpus of ./_data and renders into ./static like the app.
+
+Run from the root of the project:
+    python -m benchmarks.suite --quotes 10000 --output results.json
+    python -m benchmarks.suite --only ingest --formats .csv .txt
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from benchmarks.synthetic import WRITERS, make_quotes, write_corpus, write_images
+
+BENCHMARKS = ('ingest', 'render', 'app')
+
+
+def percentiles(latencies: list) -> dict:
+    """Summarize the latencies in seconds as milliseconds."""
+    ordered = sorted(latencies)
+
+    def at(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+    return {'mean': sum(ordered) / len(ordered) * 1000, 'p50': at(0.5), 'p90': at(0.9),
+            'p99': at(0.99), 'max': ordered[-1] * 1000}
+
+
+def peak_rss_bytes() -> int:
+    """Return the peak resident memory of the process so far."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def bench_ingest(path: str, extension: str, repeat: int) -> dict:
+    """Parse a quote file repeatedly without the quote cache."""
+    from quote_engine.ingestor import Ingestor
+
+    Ingestor.cache = None
+    latencies = []
+    quotes = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        quotes = Ingestor.parse(path, strict=True)
+        latencies.append(time.perf_counter() - started)
+    return {'benchmark': 'ingest', 'format': extension, 'quotes': len(quotes),
+            'file_bytes': os.path.getsize(path),
+            'quotes_per_sec': len(quotes) * repeat / sum(latencies),
+            'latency_ms': percentiles(latencies), 'peak_rss_bytes': peak_rss_bytes()}
+
+
+def bench_render(img_path: str, resolution: str, iterations: int, warm: bool) -> dict:
+    """Make memes of the same image with different quotes.
+
+    Warm, the decoded image and the caption overlays are cached like in the app;
+    cold, every meme decodes and resizes the image and draws its caption.
+    """
+    from meme_engine.meme_generator import MemeGenerator
+    from meme_engine.image_cache import ImageCache
+    from meme_engine.caption_overlay import OverlayCache
+
+    out_dir = tempfile.mkdtemp(prefix='meme-bench-')
+    try:
+        meme = MemeGenerator(out_dir, image_cache=ImageCache() if warm else ImageCache(0),
+                             overlay_cache=OverlayCache() if warm else None)
+        quotes = make_quotes(iterations)
+        latencies = []
+        for body, author in quotes:
+            started = time.perf_counter()
+            meme.make_meme(img_path, body, author)
+            latencies.append(time.perf_counter() - started)
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    return {'benchmark': 'render', 'resolution': resolution, 'cache': 'warm' if warm else 'cold',
+            'memes': iterations, 'memes_per_sec': iterations / sum(latencies),
+            'latency_ms': percentiles(latencies), 'peak_rss_bytes': peak_rss_bytes()}
+
+
+def bench_app(requests: int, pool_size: int) -> dict:
+    """Load test the / and /create routes through the Flask test client.
+
+    The requests are sent one after the other; a /create is timed until its
+    render job is done, and the time to queue it is reported on its own.
+    """
+    os.environ['MEME_POOL_SIZE'] = str(pool_size)
+    import app as meme_app
+
+    client = meme_app.app.test_client()
+    try:
+        # the first request pays for the lazy imports and the font loading
+        client.get('/')
+        # start from a full pool of pre-rendered memes, like an app which has been up for a while
+        deadline = time.monotonic() + 60
+        while len(meme_app.meme_pool) < pool_size and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        latencies = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            response = client.get('/')
+            latencies.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.status_code
+        index = {'requests': requests, 'requests_per_sec': requests / sum(latencies),
+                 'latency_ms': percentiles(latencies)}
+
+        submit_latencies = []
+        latencies = []
+        rejected = 0
+        for body, author in make_quotes(requests, seed=1):
+            started = time.perf_counter()
+            # a distinct quote per request, so that no job is deduplicated nor cached
+            response = client.post('/create', data={'body': f"{body} {time.time_ns()}", 'author': author},
+                                   headers={'Accept': 'application/json'})
+            submit_latencies.append(time.perf_counter() - started)
+            if response.status_code == 429:
+                rejected += 1
+                continue
+            status_url = response.json['status_url']
+            while client.get(status_url, headers={'Accept': 'application/json'}).json['status'] \
+                    not in ('done', 'failed'):
+                time.sleep(0.002)
+            latencies.append(time.perf_counter() - started)
+        create = {'requests': requests, 'rejected': rejected,
+                  'memes_per_sec': len(latencies) / sum(latencies) if latencies else 0.0,
+                  'submit_latency_ms': percentiles(submit_latencies),
+                  'latency_ms': percentiles(latencies) if latencies else None}
+    finally:
+        meme_app.meme_pool.stop()
+        meme_app.corpus.stop()
+    return {'benchmark': 'app', 'pool_size': pool_size, 'routes': {'/': index, '/create': create},
+            'peak_rss_bytes': peak_rss_bytes()}
+
+
+def run_isolated(function, *args) -> dict:
+    """Run a benchmark in a fresh process and return its result."""
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(function, *args).result()
+
+
+def describe(result: dict) -> str:
+    """Summarize a result on one line."""
+    rss = f"peak RSS {result['peak_rss_bytes'] / 2 ** 20:.0f} MB"
+    if result['benchmark'] == 'ingest':
+        return (f"ingest {result['format']:<9} {result['quotes_per_sec']:>12,.0f} quotes/s  "
+                f"p50 {result['latency_ms']['p50']:.1f} ms  {rss}")
+    if result['benchmark'] == 'render':
+        return (f"render {result['resolution']:<9} {result['cache']:<4} {result['memes_per_sec']:>7.1f} memes/s  "
+                f"p50 {result['latency_ms']['p50']:.1f} ms  p99 {result['latency_ms']['p99']:.1f} ms  {rss}")
+    index, create = result['routes']['/'], result['routes']['/create']
+    create_p99 = f"{create['latency_ms']['p99']:.1f} ms" if create['latency_ms'] else 'n/a'
+    return (f"app    /  p50 {index['latency_ms']['p50']:.1f} ms  p99 {index['latency_ms']['p99']:.1f} ms  "
+            f"/create p99 {create_p99} ({create['rejected']} rejected)  {rss}")
+
+
+def parse_resolution(value: str) -> tuple:
+    """Parse a WIDTHxHEIGHT resolution."""
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+def main():
+    """Run the selected benchmarks and write their results as JSON."""
+    parser = argparse.ArgumentParser(description='Benchmark the ingestion and rendering hot paths')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=list(BENCHMARKS),
+                        help='The benchmarks to run, all by default')
+    parser.add_argument('--quotes', type=int, default=10000,
+                        help='The number of quotes of every synthetic quote file')
+    parser.add_argument('--formats', nargs='+', choices=list(WRITERS), default=list(WRITERS),
+                        help='The formats of the quote files')
+    parser.add_argument('--repeat', type=int, default=5, help='The number of parses of every file')
+    parser.add_argument('--resolutions', nargs='+', type=parse_resolution,
+                        default=[(640, 480), (1920, 1080), (4000, 3000)],
+                        help='The WIDTHxHEIGHT of the synthetic images')
+    parser.add_argument('--memes', type=int, default=50, help='The number of memes per image')
+    parser.add_argument('--requests', type=int, default=50, help='The number of requests per route')
+    parser.add_argument('--pool-size', type=int, default=8,
+                        help='The size of the pool of pre-rendered memes of the app')
+    parser.add_argument('--output', help='The JSON file to write the results to, stdout by default')
+    args = parser.parse_args()
+
+    results = []
+    data_dir = tempfile.mkdtemp(prefix='meme-bench-data-')
+    try:
+        if 'ingest' in args.only:
+            paths = write_corpus(data_dir, args.quotes, args.formats)
+            for extension, path in paths.items():
+                results.append(run_isolated(bench_ingest, path, extension, args.repeat))
+                print(describe(results[-1]), file=sys.stderr)
+        if 'render' in args.only:
+            for (width, height), path in write_images(data_dir, args.resolutions).items():
+                for warm in (False, True):
+                    results.append(run_isolated(bench_render, path, f"{width}x{height}", args.memes, warm))
+                    print(describe(results[-1]), file=sys.stderr)
+        if 'app' in args.only:
+            results.append(run_isolated(bench_app, args.requests, args.pool_size))
+            print(describe(results[-1]), file=sys.stderr)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+              'platform': platform.platform(), 'cpus': os.cpu_count(),
+              'arguments': {key: value for key, value in vars(args).items() if key != 'output'},
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
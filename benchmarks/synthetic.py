@@ -0,0 +1,141 @@
+"""Generate synthetic quote files and images for the benchmarks."""
+import os
+import csv
+import gzip
+import json
+import random
+from PIL import Image
+
+# the words the synthetic quotes are made of
+WORDS = ('bark', 'bork', 'treat', 'walk', 'ball', 'squirrel', 'nap', 'good', 'boy', 'mailman',
+         'sock', 'chase', 'tail', 'paw', 'sniff', 'bone', 'couch', 'zoomies', 'fetch', 'belly')
+# the number of lines written on every page of a PDF file
+PDF_LINES_PER_PAGE = 50
+
+
+def make_quotes(count: int, seed: int = 0) -> list:
+    """Return count (body, author) pairs of random words, the same for the same seed."""
+    rng = random.Random(seed)
+    authors = [f"Pup {i}" for i in range(max(1, count // 20))]
+    return [(' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 10))).capitalize(),
+             rng.choice(authors))
+            for _ in range(count)]
+
+
+def write_txt(path: str, quotes: list):
+    """Write the quotes as "body - author" lines."""
+    with open(path, 'w', encoding='utf-8') as file:
+        for body, author in quotes:
+            file.write(f"{body} - {author}\n")
+
+
+def write_csv(path: str, quotes: list):
+    """Write the quotes with a body,author header."""
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['body', 'author'])
+        writer.writerows(quotes)
+
+
+def write_jsonl_gz(path: str, quotes: list):
+    """Write the quotes as gzipped JSON Lines."""
+    with gzip.open(path, 'wt', encoding='utf-8') as file:
+        for body, author in quotes:
+            file.write(json.dumps({'body': body, 'author': author}) + '\n')
+
+
+def write_docx(path: str, quotes: list):
+    """Write the quotes as one "body - author" paragraph each."""
+    # imported here like the strategy does, python-docx is only needed for this format
+    from docx import Document
+
+    document = Document()
+    for body, author in quotes:
+        document.add_paragraph(f"{body} - {author}")
+    document.save(path)
+
+
+def write_pdf(path: str, quotes: list):
+    """Write the quotes as "body - author" lines of a minimal PDF file.
+
+    The file is written by hand with a single standard font, which is all the
+    text extraction of the PDF strategy needs.
+    """
+    lines = [f"{body} - {author}" for body, author in quotes]
+    pages = [lines[i:i + PDF_LINES_PER_PAGE] for i in range(0, len(lines), PDF_LINES_PER_PAGE)] or [[]]
+
+    # the objects 1 to 3 are the catalog, the page tree and the font,
+    # then every page is followed by its content stream
+    page_ids = [4 + 2 * i for i in range(len(pages))]
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>',
+               b'<< /Type /Pages /Kids [' + b' '.join(b'%d 0 R' % i for i in page_ids)
+               + b'] /Count %d >>' % len(pages),
+               b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    for page_id, page_lines in zip(page_ids, pages):
+        text = b' T* '.join(b'(' + _pdf_escape(line) + b') Tj' for line in page_lines)
+        stream = b'BT /F1 10 Tf 14 TL 40 800 Td ' + text + b' ET'
+        objects.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+                       b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>' % (page_id + 1))
+        objects.append(b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream')
+
+    output = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    xref_offset = len(output)
+    output += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    output += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    output += (b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+               % (len(objects) + 1, xref_offset))
+    with open(path, 'wb') as file:
+        file.write(output)
+
+
+def _pdf_escape(text: str) -> bytes:
+    """Escape a line for a PDF string literal."""
+    return (text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+            .encode('latin-1', 'replace'))
+
+
+# the writer of every format, named after the extension of the files
+WRITERS = {'.txt': write_txt, '.csv': write_csv, '.docx': write_docx,
+           '.pdf': write_pdf, '.jsonl.gz': write_jsonl_gz}
+
+
+def write_corpus(directory: str, count: int, extensions=tuple(WRITERS), seed: int = 0) -> dict:
+    """Write the same count quotes in every format.
+
+        Returns:
+            the path of the file of every extension.
+    """
+    os.makedirs(directory, exist_ok=True)
+    quotes = make_quotes(count, seed)
+    paths = {}
+    for extension in extensions:
+        paths[extension] = os.path.join(directory, f"quotes-{count}{extension}")
+        WRITERS[extension](paths[extension], quotes)
+    return paths
+
+
+def write_image(path: str, width: int, height: int, seed: int = 0):
+    """Write a JPEG photo-like image: a color gradient with noise, which compresses like a photo."""
+    rng = random.Random(seed)
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 40)
+    channels = [Image.blend(gradient, noise, rng.uniform(0.2, 0.6)) for _ in range(3)]
+    Image.merge('RGB', channels).save(path, format='JPEG', quality=90)
+
+
+def write_images(directory: str, resolutions: list) -> dict:
+    """Write one image of every (width, height) resolution.
+
+        Returns:
+            the path of the image of every resolution.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for i, (width, height) in enumerate(resolutions):
+        paths[(width, height)] = os.path.join(directory, f"image-{width}x{height}.jpg")
+        write_image(paths[(width, height)], width, height, seed=i)
+    return paths
@@ -0,0 +1,139 @@
+"""Reload the quote files and the images of the app when they change, without a restart."""
+import os
+import threading
+from collections import namedtuple
+from quote_engine.ingestor import Ingestor
+from quote_engine import QuoteStore
+from meme_engine.image_catalog import ImageCatalog
+
+# the quotes and the images the requests are served from, replaced as a whole on a reload
+CorpusSnapshot = namedtuple('CorpusSnapshot', ['quotes', 'imgs'])
+
+
+class CorpusReloader:
+    """Poll the mtimes of the quote files and of the images, and re-parse only
+    the quote files and the image headers which changed.
+
+    Every reload builds a new CorpusSnapshot then swaps it in with a single assignment,
+    so the requests read a consistent snapshot and never wait for a reload.
+    """
+
+    def __init__(self, quote_files: list, images_path: str, interval: float = 5.0,
+                 image_index: str = None):
+        """Initialize the reloader; reload() must be called to load the corpus.
+
+            Arguments:
+                quote_files {list} -- the quote files to watch.
+                images_path {str} -- the directory of the images to watch.
+                interval {float} -- the seconds between two polls of the background thread.
+                image_index {str} -- the file to persist the image catalog into, none by default.
+        """
+        self.quote_files = list(quote_files)
+        self.images_path = images_path
+        self.interval = interval
+        self.catalog = ImageCatalog(images_path, image_index)
+        self.snapshot = CorpusSnapshot(QuoteStore(), [])
+        # the (size, mtime) and the parsed quotes of every quote file
+        self._file_signatures = {}
+        self._file_quotes = {}
+        # whether the snapshot holds the images of the catalog yet
+        self._images_loaded = False
+        # only one reload at a time, the others are skipped rather than waiting
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _signature(path: str):
+        """Return the (size, mtime) of a file, or None if it does not exist."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def reload(self) -> bool:
+        """Re-parse the changed quote files, list the images again if they changed,
+        and swap in the new snapshot.
+
+        Returns immediately when another reload is in progress.
+
+            Returns:
+                True if a new snapshot was swapped in.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        try:
+            return self._reload()
+        finally:
+            self._reload_lock.release()
+
+    def _reload(self) -> bool:
+        """Reload the corpus; the caller must hold the reload lock."""
+        changed_files = []
+        for path in self.quote_files:
+            signature = self._signature(path)
+            if signature != self._file_signatures.get(path):
+                changed_files.append((path, signature))
+
+        quotes_changed = False
+        # only the changed files are parsed, in parallel
+        report = Ingestor.parse_many([path for path, signature in changed_files if signature])
+        reports = {file.path: file for file in report.files}
+        for path, signature in changed_files:
+            if signature is None:
+                # the file was removed, so are its quotes
+                quotes_changed |= self._file_quotes.pop(path, None) is not None
+                self._file_signatures.pop(path, None)
+                continue
+            file = reports[path]
+            if not file.ok:
+                print(f"There is error \"{file.error}\" when parsing the file {path}")
+            if file.ok or file.quotes:
+                # the quotes read before an error are kept, like a single parse() does
+                self._file_quotes[path] = file.quotes
+                quotes_changed = True
+            # otherwise keep the quotes parsed before, the file is parsed again once it changes
+            self._file_signatures[path] = signature
+
+        # the catalog only reads the headers of the new and changed images,
+        # and may have been loaded unchanged from its persisted index
+        images_changed = self.catalog.scan() or not self._images_loaded
+        self._images_loaded = True
+
+        if not quotes_changed and not images_changed:
+            return False
+
+        quotes = self.snapshot.quotes
+        if quotes_changed:
+            # merge the quotes in the order of the quote files
+            quotes = QuoteStore(quote for path in self.quote_files
+                                for quote in self._file_quotes.get(path, ()))
+        imgs = self.catalog.paths if images_changed else self.snapshot.imgs
+        # a single assignment, the requests see either the old or the new snapshot
+        self.snapshot = CorpusSnapshot(quotes, imgs)
+        return True
+
+    def start(self):
+        """Poll for changes in a background thread."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._poll, name='corpus-reloader', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _poll(self):
+        """Reload every interval until stopped."""
+        while not self._stop.wait(self.interval):
+            try:
+                self.reload()
+            except Exception as e:
+                # the thread must survive, e.g. a directory removed while walking it
+                print(f"There is error \"{str(e)}\" when reloading the quotes and images")
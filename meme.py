@@ -1,12 +1,48 @@
 """A simple cli app starter."""
 import os
+import csv
+import json
 import random
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # Import Ingestor and MemeEngine classes
 from quote_engine.ingestor import Ingestor
 from meme_engine.meme_generator import MemeGenerator
-from quote_engine import QuoteModel
+from meme_engine.render_cache import RenderCache
+from meme_engine.image_catalog import ImageCatalog
+from quote_engine import QuoteModel, QuoteStore
+
+# the directory to save the generated memes into
+OUTPUT_PATH = r'.\output'
+# the disk quota of the memes cached in the output directory
+CACHE_MAX_BYTES = 1024 * 1024 * 1024
+# the default images and quote files of the cli
+IMAGES_PATH = "./_data/photos/dog/"
+IMAGE_INDEX = './.image_catalog.json'
+QUOTE_FILES = ['./_data/DogQuotes/DogQuotesTXT.txt',
+               './_data/DogQuotes/DogQuotesDOCX.docx',
+               './_data/DogQuotes/DogQuotesPDF.pdf',
+               './_data/DogQuotes/DogQuotesCSV.csv']
+
+
+def load_images(images=IMAGES_PATH):
+    """List all the default images, including the subdirectories."""
+    # the persisted index spares reading the image headers again on the next run
+    catalog = ImageCatalog(images, IMAGE_INDEX)
+    catalog.scan()
+    return catalog.paths
+
+
+def load_quotes(quote_files=QUOTE_FILES):
+    """Parse all the default quote files."""
+    # parse all the files in parallel, the quotes are merged in the order of quote_files
+    report = Ingestor.parse_many(quote_files)
+    for failed in report.errors:
+        print(f"There is error \"{failed.error}\" when parsing the file {failed.path}")
+    # keep the quotes in a compact store rather than one object each
+    return QuoteStore(report.quotes)
+
 
 def generate_meme(path=None, body=None, author=None):
     """Generate a meme given an path and a quote."""
@@ -16,13 +52,7 @@ def generate_meme(path=None, body=None, author=None):
 
     if path is None:
         # if the user does not specify an image path, use the default image path
-        images = "./_data/photos/dog/"
-        # list of all images under the default image path
-        imgs = []
-        # traverse a directory tree and access all the files and directories (include subdir) within it
-        for root, dirs, files in os.walk(images):
-            # store the image with the full path of that image file
-            imgs = [os.path.join(root, name) for name in files]
+        imgs = load_images()
 
         # choose a random image from default images
         if len(imgs) == 0:
@@ -34,18 +64,8 @@ def generate_meme(path=None, body=None, author=None):
         img = path
 
     if body is None:
-        # the list of all default quote files
-        quote_files = ['./_data/DogQuotes/DogQuotesTXT.txt',
-                       './_data/DogQuotes/DogQuotesDOCX.docx',
-                       './_data/DogQuotes/DogQuotesPDF.pdf',
-                       './_data/DogQuotes/DogQuotesCSV.csv']
-        # a list to store all parsed quotes
-        quotes = []
-        # parse then store each quote
-        for f in quote_files:
-            # use extend() to add to the list because
-            # we can have multiple quotes in a file
-            quotes.extend(Ingestor.parse(f))
+        # the list of all default quotes
+        quotes = load_quotes()
 
         # choose a random quote from default quotes
         if len(quotes) == 0:
@@ -59,7 +79,7 @@ def generate_meme(path=None, body=None, author=None):
         quote = QuoteModel(body, author)
 
     # create a meme object with specifying to save manipulated images into a new directory
-    meme = MemeGenerator('.\output')
+    meme = MemeGenerator(OUTPUT_PATH, render_cache=RenderCache(OUTPUT_PATH, CACHE_MAX_BYTES))
     if quote is None:
         return None
     else:
@@ -67,6 +87,90 @@ def generate_meme(path=None, body=None, author=None):
 
     return path
 
+
+def read_manifest(manifest):
+    """Read the (image, body, author) jobs of a JSONL or CSV manifest.
+
+    Every job is a dict which may omit some of the image, body and author keys.
+    """
+    with open(manifest, 'r', newline='') as file:
+        if manifest.endswith('.jsonl'):
+            # one json object per non-empty line
+            return [json.loads(line) for line in file if line.strip()]
+        # a csv file with an "image,body,author" header
+        return list(csv.DictReader(file))
+
+
+def make_jobs(count=None, manifest=None):
+    """Build the (image, body, author) jobs of a batch.
+
+    The image or the quote of a job is chosen randomly when it is not given.
+    """
+    entries = read_manifest(manifest) if manifest else [{}] * count
+
+    # only list the images and parse the quotes once for the whole batch
+    imgs = None
+    quotes = None
+    jobs = []
+    for entry in entries:
+        img = entry.get('image') or None
+        body = entry.get('body') or None
+        author = entry.get('author') or None
+        if img is None:
+            if imgs is None:
+                imgs = load_images()
+            if len(imgs) == 0:
+                print("There is no image to generate a meme")
+                continue
+            img = random.choice(imgs)
+        if body is None:
+            if quotes is None:
+                quotes = load_quotes()
+            if len(quotes) == 0:
+                print("There is no quote to generate the meme")
+                continue
+            quote = random.choice(quotes)
+            body, author = quote.quote_body, quote.author
+        elif author is None:
+            print(f"Author Required if Body is Used, skipping {entry}")
+            continue
+        jobs.append((img, body, author))
+    return jobs
+
+
+# the meme generator of a batch worker process, kept warm between jobs
+_worker_meme = None
+
+
+def _init_worker(out_path):
+    """Create the meme generator of a batch worker process."""
+    global _worker_meme
+    _worker_meme = MemeGenerator(out_path, render_cache=RenderCache(out_path, CACHE_MAX_BYTES))
+
+
+def _render_job(job):
+    """Render a single (image, body, author) job in a batch worker process."""
+    img, body, author = job
+    return _worker_meme.make_meme(img, body, author)
+
+
+def generate_batch(jobs, workers=None):
+    """Render the jobs across a pool of processes.
+
+    Yields:
+        the path of every generated meme as soon as it is done.
+    """
+    # one process per available core by default
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(OUTPUT_PATH,)) as executor:
+        futures = {executor.submit(_render_job, job): job for job in jobs}
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                print(f"There is error \"{str(e)}\" when generating the meme {futures[future]}")
+
 if __name__ == "__main__":
     """Parse the following CLI arguments:
         path - path to an image file
@@ -80,5 +184,16 @@ if __name__ == "__main__":
                             help='The quote content to add to the image')
     cli_parser.add_argument('--author', type=str, nargs='?', default=None,
                             help='The author of the quote')
+    cli_parser.add_argument('--count', type=int, default=None,
+                            help='Generate this many random memes in a batch')
+    cli_parser.add_argument('--manifest', type=str, default=None,
+                            help='A JSONL or CSV file of (image, body, author) jobs to generate in a batch')
+    cli_parser.add_argument('--workers', type=int, default=None,
+                            help='The number of batch processes, one per core by default')
     args = cli_parser.parse_args()
-    print(generate_meme(args.path, args.body, args.author))
+    if args.count or args.manifest:
+        # stream the output paths while the rest of the batch is rendering
+        for out_path in generate_batch(make_jobs(args.count, args.manifest), args.workers):
+            print(out_path, flush=True)
+    else:
+        print(generate_meme(args.path, args.body, args.author))
@@ -0,0 +1,133 @@
+"""The module lays out the caption of a meme: word wrapping and fitting the font size."""
+from collections import namedtuple
+from functools import lru_cache
+from meme_engine.font_registry import FontRegistry
+
+# the largest and the smallest font sizes tried to fit a caption
+DEFAULT_MAX_FONT_SIZE = 36
+DEFAULT_MIN_FONT_SIZE = 10
+# the part of the image height the caption may cover
+MAX_HEIGHT_RATIO = 0.4
+# the space kept between the caption and the borders of the image
+MARGIN = 8
+
+# the result of a layout: the font size, the lines with their (x, y) offsets from the
+# top left corner of the caption, the outline width and the size of the whole caption
+CaptionLayout = namedtuple('CaptionLayout',
+                           ['font_size', 'lines', 'offsets', 'stroke_width', 'width', 'height'])
+
+
+def wrap_words(text: str, font, max_width: int) -> list:
+    """Split a text into lines no wider than max_width when drawn with the given font.
+
+    A word which is too long for a line on its own is broken between characters.
+
+        Returns:
+            the list of lines.
+    """
+    lines = []
+    line = ''
+    for word in text.split():
+        candidate = f"{line} {word}" if line else word
+        if FontRegistry.text_size(font, candidate)[0] <= max_width:
+            line = candidate
+            continue
+        if line:
+            lines.append(line)
+        # break the word itself if it does not fit on a line of its own
+        while len(word) > 1:
+            cut = _longest_prefix(word, font, max_width)
+            if cut == len(word):
+                # the rest of the word fits on a line
+                break
+            lines.append(word[:cut])
+            word = word[cut:]
+        line = word
+    if line:
+        lines.append(line)
+    return lines
+
+
+def _longest_prefix(word: str, font, max_width: int) -> int:
+    """Find the length of the longest prefix of the word no wider than max_width, at least 1.
+
+    The prefix grows by doubling then is binary searched, so only prefixes up to about
+    twice a line are measured, O(log n) times, however long the word is.
+    """
+    # word[:low] fits or is the first character, word[:high] does not fit or is past the end
+    low, high = 1, 2
+    while high <= len(word) and FontRegistry.text_size(font, word[:high])[0] <= max_width:
+        low, high = high, high * 2
+    high = min(high, len(word) + 1)
+    while high - low > 1:
+        middle = (low + high) // 2
+        if FontRegistry.text_size(font, word[:middle])[0] <= max_width:
+            low = middle
+        else:
+            high = middle
+    return low
+
+
+def _fit(text: str, author: str, font, max_width: int, stroke_width: int) -> tuple:
+    """Wrap the body and the author on separate lines with the given font.
+
+        Returns:
+            the (lines, line widths, line height) of the caption.
+    """
+    # the outline makes every line wider by twice its width
+    inner_width = max(1, max_width - 2 * stroke_width)
+    lines = wrap_words(text, font, inner_width) + wrap_words(f"- {author}", font, inner_width)
+    widths = [FontRegistry.text_size(font, line)[0] + 2 * stroke_width for line in lines]
+    # the height of the tallest glyphs and the space between the lines
+    line_height = FontRegistry.text_size(font, 'Ag')[1] + 2 * stroke_width + font.size // 5
+    return lines, widths, line_height
+
+
+@lru_cache(maxsize=2048)
+def layout_caption(text: str, author: str, width: int, height: int, font_path: str,
+                   max_font_size: int = DEFAULT_MAX_FONT_SIZE,
+                   min_font_size: int = DEFAULT_MIN_FONT_SIZE) -> CaptionLayout:
+    """Find the largest font size at which the caption fits in the image, and wrap it.
+
+    The body and the author are on separate lines and every line is centered.
+    The layouts are memoized, so a repeated quote skips the computation.
+
+        Arguments:
+            text {str} -- the quote body.
+            author {str} -- the author of the quote.
+            width {int} -- the width of the image.
+            height {int} -- the height of the image.
+            font_path {str} -- the font file of the caption.
+            max_font_size {int} -- the largest font size to try.
+            min_font_size {int} -- the smallest font size, used even if the caption does not fit.
+
+        Returns:
+            the CaptionLayout.
+    """
+    max_width = max(1, width - 2 * MARGIN)
+    max_height = max(1, int(height * MAX_HEIGHT_RATIO))
+
+    def attempt(size):
+        font = FontRegistry.get_font(font_path, size)
+        stroke_width = max(1, size // 12)
+        lines, widths, line_height = _fit(text, author, font, max_width, stroke_width)
+        fits = max(widths) <= max_width and line_height * len(lines) <= max_height
+        return fits, (size, lines, widths, line_height, stroke_width)
+
+    # binary search of the largest size which fits, the smaller sizes fit as well
+    low, high = min_font_size, max(min_font_size, max_font_size)
+    _, best = attempt(low)
+    while low < high:
+        middle = (low + high + 1) // 2
+        middle_fits, result = attempt(middle)
+        if middle_fits:
+            low, best = middle, result
+        else:
+            high = middle - 1
+
+    size, lines, widths, line_height, stroke_width = best
+    caption_width = max(widths)
+    offsets = tuple(((caption_width - line_width) // 2 + stroke_width, index * line_height + stroke_width)
+                    for index, line_width in enumerate(widths))
+    return CaptionLayout(size, tuple(lines), offsets, stroke_width,
+                         caption_width, line_height * len(lines))
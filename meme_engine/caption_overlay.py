@@ -0,0 +1,78 @@
+"""The module rasterizes the captions into transparent layers which are reused across memes."""
+from PIL import Image, ImageDraw
+from meme_engine.font_registry import FontRegistry
+from meme_engine.image_cache import ImageCache
+
+
+def draw_caption(img, layout, font_path: str, coords: tuple, fill, outline):
+    """Draw the lines of a caption layout on an image.
+
+        Arguments:
+            img {Image} -- the image to draw on.
+            layout {CaptionLayout} -- the wrapped lines and the font size of the caption.
+            font_path {str} -- the font file of the caption.
+            coords {tuple} -- the (x, y) of the top left corner of the caption.
+            fill -- the color of the text.
+            outline -- the color of the outline of the text.
+    """
+    # create an ImageDraw object from the given image
+    draw_img = ImageDraw.Draw(img)
+    # define the font of the text, each font file is only parsed once per size
+    font = FontRegistry.get_font(font_path, layout.font_size)
+    # add the text line by line
+    for line, (offset_x, offset_y) in zip(layout.lines, layout.offsets):
+        draw_img.text((coords[0] + offset_x, coords[1] + offset_y), line,
+                      fill = fill, font = font,
+                      stroke_width = layout.stroke_width, stroke_fill = outline)
+
+
+def render_overlay(layout, font_path: str, fill, outline):
+    """Rasterize a caption into a transparent RGBA layer of the size of the caption.
+
+        Returns:
+            the overlay, to paste on an image with itself as the mask.
+    """
+    overlay = Image.new('RGBA', (max(1, layout.width), max(1, layout.height)), (0, 0, 0, 0))
+    draw_caption(overlay, layout, font_path, (0, 0), fill, outline)
+    return overlay
+
+
+class OverlayCache:
+    """A cache of the rasterized captions, bounded by the memory of their pixels.
+
+    The overlays are keyed by (layout, font, style), and the layout already depends on
+    the text, the author and the image size, so the glyphs of a caption are rasterized
+    once and only composited on the following memes.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        """Initialize an empty cache.
+
+            Arguments:
+                max_bytes {int} -- the maximum number of bytes of overlay pixels to keep.
+        """
+        self._images = ImageCache(max_bytes)
+
+    @property
+    def hits(self) -> int:
+        """The number of overlays reused."""
+        return self._images.hits
+
+    @property
+    def misses(self) -> int:
+        """The number of overlays rasterized."""
+        return self._images.misses
+
+    def get(self, layout, font_path: str, fill, outline):
+        """Return the overlay of the caption, rasterizing it on a cache miss."""
+        key = (layout, font_path, fill, outline)
+        return self._images.get_or_create(
+            key, lambda: render_overlay(layout, font_path, fill, outline))
+
+    def clear(self):
+        """Remove all the overlays."""
+        self._images.clear()
+
+
+# the cache shared by all the meme generators of the process
+default_overlay_cache = OverlayCache()
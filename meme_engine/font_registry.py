@@ -0,0 +1,61 @@
+"""The module loads every font face once per process and memoizes text measurements."""
+import threading
+from functools import lru_cache
+from PIL import ImageFont
+from metrics import stage_seconds
+
+# the font used by the memes when no other font is given
+DEFAULT_FONT_PATH = 'LilitaOne-Regular.ttf'
+DEFAULT_FONT_SIZE = 14
+
+
+class FontRegistry:
+    """A process-wide pool of font objects keyed by (font file, size)."""
+
+    # the loaded fonts keyed by (font file, size)
+    _fonts = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_font(cls, font_path: str = DEFAULT_FONT_PATH, size: int = DEFAULT_FONT_SIZE):
+        """Return the font for the given file and size, parsing the file only once.
+
+            Arguments:
+                font_path {str} -- the file location for the TrueType font.
+                size {int} -- the size of the font.
+
+            Returns:
+                the shared FreeTypeFont object.
+        """
+        key = (font_path, size)
+        font = cls._fonts.get(key)
+        if font is None:
+            with cls._lock:
+                # another thread may have loaded the font while waiting for the lock
+                font = cls._fonts.get(key)
+                if font is None:
+                    with stage_seconds.time('font_load'):
+                        font = ImageFont.truetype(font_path, size=size)
+                    cls._fonts[key] = font
+        return font
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def text_size(font, text: str) -> tuple:
+        """Measure the given text drawn with the given font.
+
+        The fonts are shared by the registry, so the font object itself is a stable key.
+
+            Returns:
+                the (width, height) of the text.
+        """
+        # the right and bottom of the bounding box match the former getsize()
+        _, _, right, bottom = font.getbbox(text)
+        return right, bottom
+
+    @classmethod
+    def clear(cls):
+        """Forget all the loaded fonts and text measurements."""
+        with cls._lock:
+            cls._fonts.clear()
+        cls.text_size.cache_clear()
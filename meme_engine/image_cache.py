@@ -0,0 +1,150 @@
+"""The module keeps decoded and resized images in memory between memes."""
+import os
+import threading
+from collections import OrderedDict
+
+
+class ImageCache:
+    """A least-recently-used cache of resized base images.
+
+    The cache is bounded by the number of bytes the decoded pixels take in memory,
+    and each entry is keyed by (path, mtime, width, options) so an edited image is reloaded.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        """Initialize an empty cache.
+
+            Arguments:
+                max_bytes {int} -- the maximum number of bytes of decoded pixels to keep.
+        """
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        # the cached images ordered from the least to the most recently used
+        self._entries = OrderedDict()
+        # the latest key of every (path, width, options) slot to drop outdated versions
+        self._latest_keys = {}
+        self._key_slots = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def image_bytes(img) -> int:
+        """Estimate the memory taken by the pixels of the given image.
+
+            Returns:
+                the number of bytes of the decoded image.
+        """
+        return img.width * img.height * len(img.getbands())
+
+    def get(self, img_path: str, width: int, loader, options: tuple = ()):
+        """Return the resized image, loading it with the loader on a cache miss.
+
+            Arguments:
+                img_path {str} -- the file location for the input image.
+                width {int} -- the desired width of the image.
+                loader {callable} -- called as loader(img_path, width) on a miss.
+                options {tuple} -- the settings of the loader which change the image.
+
+            Returns:
+                the cached image, which must be copied before drawing on it.
+        """
+        path = os.path.abspath(img_path)
+        # raise FileNotFoundError before trying to load a missing image
+        key = (path, os.path.getmtime(path), width, options)
+
+        with self._lock:
+            img = self._entries.get(key)
+            if img is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return img
+            self.misses += 1
+
+        # decode outside the lock so that other images can be served meanwhile
+        img = loader(img_path, width)
+        self.put(key, img, self._slot(key))
+        return img
+
+    def get_or_create(self, key, factory):
+        """Return the image cached under any hashable key, creating it with the factory on a miss.
+
+            Arguments:
+                key {hashable} -- the key of the image, e.g. the inputs of the factory.
+                factory {callable} -- called without arguments to create the image.
+
+            Returns:
+                the cached image, which must not be altered.
+        """
+        with self._lock:
+            img = self._entries.get(key)
+            if img is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return img
+            self.misses += 1
+
+        img = factory()
+        self.put(key, img)
+        return img
+
+    def put(self, key, img, slot: tuple = None):
+        """Store the image under the key and evict the least recently used images.
+
+        The slot identifies the versions of the same image, only the latest one is kept.
+        """
+        size = self.image_bytes(img)
+        # never keep an image which is bigger than the whole cache
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            # drop the outdated version of the same image, width and options if any
+            if slot is not None:
+                old_key = self._latest_keys.get(slot)
+                if old_key is not None and old_key != key:
+                    self._remove(old_key)
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = img
+            if slot is not None:
+                self._latest_keys[slot] = key
+                self._key_slots[key] = slot
+            self.current_bytes += size
+
+            # evict from the least recently used end until the cache fits
+            while self.current_bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+
+    def _remove(self, key):
+        """Remove an entry; the caller must hold the lock."""
+        img = self._entries.pop(key, None)
+        if img is None:
+            return
+        self.current_bytes -= self.image_bytes(img)
+        slot = self._key_slots.pop(key, None)
+        if slot is not None and self._latest_keys.get(slot) == key:
+            del self._latest_keys[slot]
+
+    @staticmethod
+    def _slot(key: tuple) -> tuple:
+        """Return the key without the mtime, which is shared by all the versions of an image."""
+        return (key[0],) + key[2:]
+
+    def clear(self):
+        """Remove all cached images."""
+        with self._lock:
+            self._entries.clear()
+            self._latest_keys.clear()
+            self._key_slots.clear()
+            self.current_bytes = 0
+
+    def __len__(self):
+        """Return the number of cached images."""
+        return len(self._entries)
+
+
+# the cache shared by all the meme generators of the process
+default_image_cache = ImageCache()
@@ -0,0 +1,186 @@
+"""The module finds the images of a directory tree and indexes their metadata."""
+import os
+import json
+import random
+import tempfile
+import threading
+from bisect import bisect_left
+from collections import namedtuple
+from PIL import Image
+
+# the metadata of an image, read from its header only
+ImageInfo = namedtuple('ImageInfo', ['path', 'size', 'mtime_ns', 'width', 'height', 'format', 'mode'])
+
+
+class ImageCatalog:
+    """A catalog of all the images under a directory, including subdirectories.
+
+    Only the header of an image is read, for its dimensions, format and mode.
+    The catalog can be persisted with the size and mtime of every image,
+    so a rescan only reads the headers of the new or changed images.
+    """
+
+    # the extensions of the files which are considered images
+    extensions = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp')
+    # bump when the format of the persisted index changes
+    version = 1
+
+    def __init__(self, root: str, index_path: str = None):
+        """Initialize the catalog, loading the persisted index if any.
+
+            Arguments:
+                root {str} -- the directory of the images.
+                index_path {str} -- the JSON file to persist the index into, none by default.
+        """
+        self.root = root
+        self.index_path = index_path
+        # the images by path
+        self._images = {}
+        # the paths sorted by width and their widths, to sample by minimum width
+        self._by_width = []
+        self._widths = []
+        self._lock = threading.Lock()
+        self._load_index()
+
+    @property
+    def paths(self) -> list:
+        """The paths of all the images, sorted."""
+        return sorted(self._images)
+
+    def get(self, path: str):
+        """Return the ImageInfo of the given path, or None if it is not in the catalog."""
+        return self._images.get(path)
+
+    def __len__(self):
+        """Return the number of images."""
+        return len(self._images)
+
+    def scan(self) -> bool:
+        """Walk the directory tree and update the catalog.
+
+        Only the new and changed images are opened, to read their header.
+
+            Returns:
+                True if the catalog changed.
+        """
+        with self._lock:
+            images = {}
+            changed = False
+            for path, stat in self._walk(self.root):
+                info = self._images.get(path)
+                if info is None or info.size != stat.st_size or info.mtime_ns != stat.st_mtime_ns:
+                    info = self._read_header(path, stat)
+                    if info is None:
+                        continue
+                    changed = True
+                images[path] = info
+            # the removed images
+            changed |= len(images) != len(self._images) or images.keys() != self._images.keys()
+
+            if changed:
+                self._set_images(images)
+                self._save_index()
+            return changed
+
+    def sample(self, min_width: int = 0, min_height: int = 0, formats=None, rng=random):
+        """Pick a random image matching the constraints.
+
+            Arguments:
+                min_width {int} -- the minimum width of the image.
+                min_height {int} -- the minimum height of the image.
+                formats {iterable} -- the allowed formats, e.g. ['JPEG'], any by default.
+                rng {random.Random} -- the source of randomness.
+
+            Returns:
+                the path of the image, or None when no image matches.
+        """
+        # the images wide enough are at the end of the list sorted by width
+        by_width = self._by_width
+        start = bisect_left(self._widths, min_width)
+        count = len(by_width) - start
+        if count <= 0:
+            return None
+        formats = set(formats) if formats else None
+
+        def matches(info):
+            return info.height >= min_height and (formats is None or info.format in formats)
+
+        # most images usually match, so try a few random picks before filtering
+        for _ in range(16):
+            info = by_width[start + rng.randrange(count)]
+            if matches(info):
+                return info.path
+        candidates = [info for info in by_width[start:] if matches(info)]
+        return rng.choice(candidates).path if candidates else None
+
+    def _walk(self, directory: str):
+        """Yield the (path, stat) of every image under the directory with os.scandir."""
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return
+        for entry in entries:
+            # a symlink to a directory is not followed, it could loop back to a parent
+            if entry.is_dir(follow_symlinks=False):
+                # keep the images of every subdirectory
+                yield from self._walk(entry.path)
+            elif entry.is_file() and entry.name.lower().endswith(self.extensions):
+                yield entry.path, entry.stat()
+
+    @staticmethod
+    def _read_header(path: str, stat):
+        """Read the metadata of an image without decoding its pixels.
+
+            Returns:
+                the ImageInfo, or None if the file is not an image Pillow can open.
+        """
+        try:
+            # open() only parses the header, the pixels are decoded on load()
+            with Image.open(path) as img:
+                width, height = img.size
+                return ImageInfo(path, stat.st_size, stat.st_mtime_ns, width, height,
+                                 img.format, img.mode)
+        except (OSError, SyntaxError) as e:
+            print(f"There is error \"{str(e)}\" when reading the image {path}")
+            return None
+
+    def _set_images(self, images: dict):
+        """Replace the images and their width index."""
+        by_width = sorted(images.values(), key=lambda info: info.width)
+        self._images = images
+        self._by_width = by_width
+        self._widths = [info.width for info in by_width]
+
+    def _load_index(self):
+        """Load the persisted index if it exists and matches this version."""
+        if self.index_path is None:
+            return
+        try:
+            with open(self.index_path, 'r') as file:
+                index = json.load(file)
+        except (OSError, ValueError):
+            return
+        try:
+            if index.get('version') != self.version or index.get('root') != self.root:
+                return
+            # sorting by width also fails on a malformed row
+            self._set_images({row[0]: ImageInfo(*row) for row in index.get('images', [])})
+        except (AttributeError, TypeError, IndexError, KeyError) as e:
+            # a malformed index is ignored, it is rebuilt by scanning the images
+            print(f"There is error \"{str(e)}\" when loading the image index {self.index_path}")
+            self._set_images({})
+
+    def _save_index(self):
+        """Persist the index, writing a temporary file then renaming it."""
+        if self.index_path is None:
+            return
+        index = {'version': self.version, 'root': self.root,
+                 'images': [list(info) for info in self._images.values()]}
+        try:
+            directory = os.path.dirname(self.index_path) or '.'
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as file:
+                json.dump(index, file)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            print(f"There is error \"{str(e)}\" when saving the image index {self.index_path}")
@@ -0,0 +1,264 @@
+"""The module downloads remote images for the memes with bounded time and memory."""
+import os
+import time
+import socket
+import ipaddress
+import threading
+from io import BytesIO
+from collections import OrderedDict
+from urllib.parse import urljoin, urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from PIL import Image, UnidentifiedImageError
+from metrics import stage_seconds
+
+
+class FetchError(Exception):
+    """Raised when a remote image cannot be downloaded or is not an image."""
+
+
+class ImageTooLargeError(FetchError):
+    """Raised when a remote image is bigger than the allowed number of bytes."""
+
+
+def is_public_address(address: str) -> bool:
+    """Check whether an IP address is reachable on the internet, rather than private, loopback or link-local."""
+    ip = ipaddress.ip_address(address.split('%')[0])
+    # e.g. ::ffff:127.0.0.1 reaches the IPv4 loopback
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+class ImageFetcher:
+    """Download images through a shared pool of HTTP connections.
+
+    Every download has connect and read timeouts plus an overall deadline, and is
+    streamed so that it stops as soon as it goes over the maximum number of bytes.
+    The downloads are cached by URL and revalidated with ETag / Last-Modified.
+
+    The URLs come from the users, so by default the hosts which resolve to a private,
+    loopback or link-local address are refused, for the URL and for every redirect,
+    and the address actually connected to is checked again before the body is read.
+    """
+
+    # the number of redirects followed by a download
+    max_redirects = 5
+
+    def __init__(self, session=None, connect_timeout: float = 3.05, read_timeout: float = 10,
+                 deadline: float = 20, max_bytes: int = 10 * 1024 * 1024,
+                 cache_max_bytes: int = 32 * 1024 * 1024, pool_size: int = 10,
+                 allow_private: bool = False):
+        """Initialize the fetcher.
+
+            Arguments:
+                session {requests.Session} -- the HTTP session, a pooled one by default.
+                connect_timeout {float} -- the seconds to wait for a connection.
+                read_timeout {float} -- the seconds to wait for each chunk of the response.
+                deadline {float} -- the maximum seconds of a whole download.
+                max_bytes {int} -- the maximum size of an image.
+                cache_max_bytes {int} -- the maximum size of all the cached downloads.
+                pool_size {int} -- the number of connections kept open per host.
+                allow_private {bool} -- download from the private, loopback and link-local
+                    addresses as well, e.g. from a local test server.
+        """
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+        self.timeout = (connect_timeout, read_timeout)
+        self.deadline = deadline
+        self.max_bytes = max_bytes
+        self.cache_max_bytes = cache_max_bytes
+        self.allow_private = allow_private
+        self.cache_bytes = 0
+        # the cached downloads (url -> (etag, last_modified, content)), least recently used first
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def fetch(self, url: str) -> bytes:
+        """Download the content at the given URL.
+
+            Returns:
+                the downloaded bytes.
+
+            Raises:
+                FetchError -- when the download fails, is too slow or is too large.
+        """
+        with self._lock:
+            cached = self._cache.get(url)
+            if cached is not None:
+                self._cache.move_to_end(url)
+
+        headers = {}
+        if cached is not None:
+            etag, last_modified, _ = cached
+            # ask the server to only send the image again if it changed
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+
+        started = time.monotonic()
+        try:
+            with self._get(url, headers) as response:
+                if response.status_code == 304 and cached is not None:
+                    return cached[2]
+                if response.status_code != 200:
+                    raise FetchError(f"Downloading {url} failed with status {response.status_code}")
+
+                content = self._read(url, response, started)
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+        except requests.RequestException as e:
+            raise FetchError(f"Downloading {url} failed: {e}") from e
+
+        if etag or last_modified:
+            self._store(url, (etag, last_modified, content))
+        return content
+
+    def fetch_image(self, url: str) -> BytesIO:
+        """Download an image and check that it can be decoded, without saving it to a file.
+
+            Returns:
+                a buffer holding the image, positioned at its start.
+
+            Raises:
+                FetchError -- when the download fails or the content is not an image.
+        """
+        with stage_seconds.time('download'):
+            buffer = BytesIO(self.fetch(url))
+        try:
+            # only the header is read, the pixels are decoded by the meme generator
+            Image.open(buffer)
+        except UnidentifiedImageError as e:
+            raise FetchError(f"The content of {url} is not an image") from e
+        buffer.seek(0)
+        return buffer
+
+    def _get(self, url: str, headers: dict):
+        """Send the request, following the redirects only to the allowed hosts.
+
+            Returns:
+                the streamed response of the last URL.
+        """
+        for _ in range(self.max_redirects + 1):
+            self._check_host(url)
+            response = self.session.get(url, headers=headers, timeout=self.timeout, stream=True,
+                                        allow_redirects=False)
+            try:
+                self._check_peer(url, response)
+            except FetchError:
+                response.close()
+                raise
+            if not response.is_redirect:
+                return response
+            # the next URL may be relative to the current one
+            next_url = urljoin(url, response.headers['Location'])
+            response.close()
+            url = next_url
+        raise FetchError(f"Downloading {url} took more than {self.max_redirects} redirects")
+
+    def _check_host(self, url: str):
+        """Refuse an URL whose host resolves to an address which is not public."""
+        if self.allow_private:
+            return
+        try:
+            parts = urlsplit(url)
+            port = parts.port or (443 if parts.scheme == 'https' else 80)
+        except ValueError as e:
+            raise FetchError(f"The URL {url} is not valid: {e}") from e
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise FetchError(f"The URL {url} is not an http or https URL")
+        try:
+            addresses = socket.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+        except (OSError, UnicodeError) as e:
+            raise FetchError(f"The host of {url} cannot be resolved: {e}") from e
+        for *_, sockaddr in addresses:
+            if not is_public_address(sockaddr[0]):
+                raise FetchError(f"The host of {url} is not a public address")
+
+    def _check_peer(self, url: str, response):
+        """Refuse a response from an address which is not public.
+
+        The host may resolve to another address when the connection is made than
+        when it was checked, so the address actually connected to is checked too.
+        """
+        if self.allow_private:
+            return
+        try:
+            # a duplicate of the descriptor of the connection, of the right address family
+            with socket.socket(fileno=os.dup(response.raw.fileno())) as sock:
+                address = sock.getpeername()[0]
+        except (OSError, ValueError, AttributeError):
+            # e.g. the body was empty and the connection is already released
+            return
+        if not is_public_address(address):
+            raise FetchError(f"The host of {url} is not a public address")
+
+    def _read(self, url: str, response, started: float) -> bytes:
+        """Read the body of the response, stopping at the maximum size or the deadline.
+
+        A host sending a byte at a time never times out a read nor completes a chunk,
+        so a watchdog interrupts the read from another thread once the deadline passes.
+        """
+        length = response.headers.get('Content-Length')
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            raise ImageTooLargeError(f"The image {url} is larger than {self.max_bytes} bytes")
+
+        expired = threading.Event()
+
+        def expire():
+            expired.set()
+            self._abort(response)
+
+        watchdog = threading.Timer(max(0.0, self.deadline - (time.monotonic() - started)), expire)
+        watchdog.daemon = True
+        watchdog.start()
+        chunks = []
+        size = 0
+        try:
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                size += len(chunk)
+                # the Content-Length may be missing or wrong, so count the bytes actually read
+                if size > self.max_bytes:
+                    raise ImageTooLargeError(f"The image {url} is larger than {self.max_bytes} bytes")
+                chunks.append(chunk)
+        except Exception as e:
+            if expired.is_set():
+                raise FetchError(f"Downloading {url} took more than {self.deadline} seconds") from e
+            raise
+        finally:
+            watchdog.cancel()
+        # the interrupted read may also look like the end of the body
+        if expired.is_set():
+            raise FetchError(f"Downloading {url} took more than {self.deadline} seconds")
+        return b''.join(chunks)
+
+    @staticmethod
+    def _abort(response):
+        """Interrupt a read of the response blocked in another thread."""
+        try:
+            # a duplicate of the descriptor of the connection, shutting it down shuts
+            # the connection down, and unlike close() it wakes up a blocked recv()
+            with socket.fromfd(response.raw.fileno(), socket.AF_INET, socket.SOCK_STREAM) as sock:
+                sock.shutdown(socket.SHUT_RDWR)
+        except (OSError, ValueError, AttributeError):
+            response.close()
+
+    def _store(self, url: str, entry: tuple):
+        """Cache a download and evict the least recently used ones."""
+        size = len(entry[2])
+        if size > self.cache_max_bytes:
+            return
+        with self._lock:
+            old_entry = self._cache.pop(url, None)
+            if old_entry is not None:
+                self.cache_bytes -= len(old_entry[2])
+            self._cache[url] = entry
+            self.cache_bytes += size
+            while self.cache_bytes > self.cache_max_bytes:
+                _, (_, _, content) = self._cache.popitem(last=False)
+                self.cache_bytes -= len(content)
@@ -1,81 +1,374 @@
 """The module is responsible for manipulating and drawing text onto images"""
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image
 import random
 import os
-from time_utils import get_current_time
+import shutil
+from io import BytesIO
+from functools import lru_cache
+from meme_engine.output_store import OutputStore, unique_file_name, atomic_save
+from meme_engine.image_cache import default_image_cache
+from meme_engine.font_registry import DEFAULT_FONT_PATH
+from meme_engine.caption_overlay import default_overlay_cache, draw_caption
+from meme_engine.caption_layout import (layout_caption, MARGIN, DEFAULT_MAX_FONT_SIZE,
+                                        DEFAULT_MIN_FONT_SIZE)
+from meme_engine.render_cache import RenderCache
+from metrics import stage_seconds
+
+# the extension of the files of every output format
+EXTENSIONS = {'JPEG': '.jpg', 'WEBP': '.webp', 'PNG': '.png'}
+# the (width, format) of the variants rendered by default: a full size and a thumbnail, in JPEG and WebP
+DEFAULT_VARIANTS = ((500, 'JPEG'), (150, 'JPEG'), (500, 'WEBP'), (150, 'WEBP'))
+
+
+@lru_cache(maxsize=4096)
+def source_size(path: str, mtime_ns: int) -> tuple:
+    """Read the (width, height) of a source image from its header, once per version of the image."""
+    with Image.open(path) as img:
+        return img.size
+
+
+def scaled_height(size: tuple, width: int) -> int:
+    """Return the height of an image of the given (width, height) scaled to the width, like load_image()."""
+    return int(width / float(size[0]) * float(size[1]))
 
 class MemeGenerator:
     """The class which is responsible for loading images, resizing them, adding captions
     and handling the generation of the final memes."""
     
-    def __init__(self, out_path:str):
+    def __init__(self, out_path, image_cache=None,
+                 font_path: str = DEFAULT_FONT_PATH, font_size: int = DEFAULT_MAX_FONT_SIZE,
+                 min_font_size: int = DEFAULT_MIN_FONT_SIZE, render_cache=None,
+                 overlay_cache=default_overlay_cache, text_color="blue", outline_color="white", resample=Image.BICUBIC, draft: bool = True,
+                 reducing_gap: float = 2.0, quality: int = 75,
+                 progressive: bool = False, optimize: bool = False):
         """Initialize the MemeGenerator.
 
             Arguments:
-                img_path {str} -- the file location for the input image.
+                out_path {str or OutputStore} -- the directory to save the output images into,
+                    or the OutputStore which shards the directory and bounds its size.
+                image_cache {ImageCache} -- the cache of resized base images,
+                    the cache shared by the whole process is used by default.
+                font_path {str} -- the default TrueType font file of the captions.
+                font_size {int} -- the default largest font size of the captions, which
+                    are shrunk down to min_font_size until they fit in the image.
+                min_font_size {int} -- the smallest font size of the captions.
+                render_cache {RenderCache} -- the cache of rendered memes, which are
+                    always rendered again when it is None.
+                overlay_cache {OverlayCache} -- the cache of rasterized captions, which are
+                    drawn directly on every meme when it is None.
+                text_color -- the color of the captions.
+                outline_color -- the color of the outline of the captions.
+                resample {int} -- the Pillow filter of the final resize, e.g. Image.LANCZOS
+                    for the best quality or Image.BILINEAR for speed.
+                draft {bool} -- decode the JPEG images at the smallest scale (1/2, 1/4
+                    or 1/8) which is still larger than the output, instead of fully.
+                reducing_gap {float} -- reduce a large image by an integer factor before
+                    the final resize, when it is that many times larger; None disables it.
+                quality {int} -- the JPEG quality of the output, from 1 to 95.
+                progressive {bool} -- write progressive JPEG images.
+                optimize {bool} -- optimize the JPEG encoding, smaller but slower.
+        """
+        # the memes which are not in the render cache are written by the output store
+        self.output_store = out_path if isinstance(out_path, OutputStore) else OutputStore(out_path)
+        self.out_path = self.output_store.root
+        self.image_cache = image_cache if image_cache is not None else default_image_cache
+        self.font_path = font_path
+        self.font_size = font_size
+        self.min_font_size = min_font_size
+        self.render_cache = render_cache
+        self.overlay_cache = overlay_cache
+        self.text_color = text_color
+        self.outline_color = outline_color
+        self.resample = resample
+        self.draft = draft
+        self.reducing_gap = reducing_gap
+        self.quality = quality
+        self.progressive = progressive
+        self.optimize = optimize
+
+    def load_image(self, img_path, width: int):
+        """Decode the given image and resize it to the given width.
+
+        A large JPEG image is decoded in draft mode at a reduced scale, then
+        reduced by an integer factor, and only the rest is resampled with the filter.
+
+            Arguments:
+                img_path {str} -- the file location or a file object for the input image.
+                width {int} -- the desired width of the output image
+
+            Return:
+                the resized image.
         """
-        self.out_path = out_path
+        with Image.open(img_path) as img:
+            # the height is scaled proportionally
+            height = scaled_height(img.size, width)
+            with stage_seconds.time('decode'):
+                if self.draft and img.format == 'JPEG':
+                    # let the decoder skip the pixels the output does not need, in the same mode
+                    img.draft(img.mode, (width, height))
+                # decode the pixels so the file can be closed
+                img.load()
+            # resize the image
+            with stage_seconds.time('resize'):
+                img = img.resize((width, height), resample=self.resample,
+                                 reducing_gap=self.reducing_gap)
+        # e.g. a transparent PNG, which could not be saved as a JPEG
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        return img
+
+    def load_options(self) -> tuple:
+        """Return the settings which change the resized images, to key the image cache."""
+        return (self.resample, self.draft, self.reducing_gap)
+
+    def save_options(self, format: str = 'JPEG') -> dict:
+        """Return the settings of the encoder of the given format."""
+        if format == 'WEBP':
+            return {'quality': self.quality}
+        if format == 'PNG':
+            return {'optimize': self.optimize}
+        return {'quality': self.quality, 'progressive': self.progressive,
+                'optimize': self.optimize}
         
-    def make_meme(self, img_path: str, text: str, author: str, width=500) -> str:
-        """Manipulate the given image.
+    def render(self, img_path: str, text: str, author: str, width=500,
+               font_path: str = None, font_size: int = None):
+        """Load the given image and add the caption to it.
         
             Arguments:
-                img_path {str} -- the file location for the input image.
+                img_path {str} -- the file location or a file object for the input image.
                 text {str} -- the text which is the quote body to add to the image
                 author {str} -- the author of the quote and need to add to the image
                 width {int} -- the desired width of the output image
+                font_path {str} -- the font file of the caption, the generator's by default
+                font_size {int} -- the largest font size of the caption, the generator's by default
             
             Return:
-                the file location for the output image.
+                the manipulated image.
         """
-        # Load the image
-        try:
-            img = Image.open(img_path)
-        except FileNotFoundError:
-            print(f"File {img_path} is not found")
-
-        """Resize the image
+        """Load the resized image
         """
-        # the height is scaled proportionally
-        ratio = width/float(img.size[0])
-        height = int(ratio * float(img.size[1]))
-        # resize the image
-        img = img.resize((width, height))
+        if isinstance(img_path, str):
+            # decoding and resizing only happen once per (path, mtime, width)
+            base_img = self.image_cache.get(img_path, width, self.load_image,
+                                            self.load_options())
+            # copy the small cached image so that drawing does not alter the cache
+            img = base_img.copy()
+        else:
+            # an image in memory, e.g. downloaded, is used once so it is not cached
+            img = self.load_image(img_path, width)
 
         """Add quote to the image
         """
-        # create an ImageDraw object from the original image
-        draw_img = ImageDraw.Draw(img)
-        # define the text
-        text_content = f"{text} - {author}"
-        # define color of the text
-        text_color = "blue"
-        # define the font of the text
-        font = ImageFont.truetype('LilitaOne-Regular.ttf', size=14)
+        # wrap the body and the author on separate lines at the largest font size which fits,
+        # the layout is memoized for the same text, image size and font
+        font_path = font_path or self.font_path
+        with stage_seconds.time('layout'):
+            layout = layout_caption(text, author, img.width, img.height, font_path,
+                                    font_size or self.font_size, self.min_font_size)
         # define the text coordinates
-            # calculate the maximum allowed coordinates for the text
-        max_x = img.width - font.getsize(text_content)[0]
-        max_y = img.height - font.getsize(text_content)[1]
+            # the caption stays inside the image even if it is too large to fit
+        max_x = max(MARGIN, img.width - layout.width - MARGIN)
+        max_y = max(MARGIN, img.height - layout.height - MARGIN)
         text_coords = (
-            random.randint(0, max_x),
-            random.randint(0, max_y)
+            random.randint(min(MARGIN, max_x), max_x),
+            random.randint(min(MARGIN, max_y), max_y)
         )
-        # add the text
-        draw_img.text(text_coords, text_content, fill = text_color, font = font)
+        with stage_seconds.time('draw'):
+            if self.overlay_cache is not None:
+                # the caption is rasterized once, then only composited onto the image
+                overlay = self.overlay_cache.get(layout, font_path, self.text_color, self.outline_color)
+                img.paste(overlay, text_coords, overlay)
+            else:
+                # add the text line by line
+                draw_caption(img, layout, font_path, text_coords, self.text_color, self.outline_color)
+
+        return img
+
+    def cache_key(self, img_path: str, text: str, author: str, width=500,
+                  font_path: str = None, font_size: int = None) -> str:
+        """Hash the inputs of a meme together with the state of its source image.
+
+            Return:
+                the key of the meme in the render cache.
+        """
+        return RenderCache.make_key(img_path, text, author, width,
+                                    font_path or self.font_path, font_size or self.font_size,
+                                    (self.min_font_size, self.text_color, self.outline_color)
+                                    + self.load_options() + tuple(sorted(self.save_options().items())))
+
+    def make_meme(self, img_path: str, text: str, author: str, width=500,
+                  font_path: str = None, font_size: int = None) -> str:
+        """Manipulate the given image and save it into the output directory.
+        
+            Arguments:
+                img_path {str} -- the file location or a file object for the input image.
+                text {str} -- the text which is the quote body to add to the image
+                author {str} -- the author of the quote and need to add to the image
+                width {int} -- the desired width of the output image
+                font_path {str} -- the font file of the caption, the generator's by default
+                font_size {int} -- the largest font size of the caption, the generator's by default
+            
+            Return:
+                the file location for the output image.
+        """
+        """Look up the rendered meme
+        """
+        cache_key = None
+        try:
+            # only the images on disk have a stable identity to cache the meme by
+            if self.render_cache is not None and isinstance(img_path, str):
+                cache_key = self.cache_key(img_path, text, author, width, font_path, font_size)
+                # an identical meme was rendered before, Pillow is not needed at all
+                cached_path = self.render_cache.get(cache_key)
+                if cached_path is not None:
+                    return cached_path
+
+            img = self.render(img_path, text, author, width, font_path, font_size)
+        except FileNotFoundError:
+            print(f"File {img_path} is not found")
+            return None
 
         """Save the image
         """
         # out_img_path = os.path.join(self.out_path, get_current_time() + ".jpg")
         # img.save(out_img_path)
         # Check if the output directory exists, create it if it doesn't
-        if not os.path.exists(self.out_path):
-            os.makedirs(self.out_path)
-        # Generate the output file name
-        file_name = get_current_time() + ".jpg"
-        out_img_path = os.path.join(self.out_path, file_name)
-        img.save(out_img_path)
+        # (exist_ok avoids a race with the other workers creating it)
+        if cache_key is not None:
+            # the cached meme is named after its inputs, in the shard of its key
+            out_img_path = self.render_cache.path_for(cache_key)
+            # write into a temporary file then rename it, so no reader sees a partial image
+            atomic_save(img, out_img_path, **self.save_options())
+            self.render_cache.add(cache_key)
+        else:
+            # Generate an output file name which cannot collide with the other workers,
+            # the store saves it atomically into its shard
+            out_img_path = self.output_store.save(img, unique_file_name(".jpg"),
+                                                  **self.save_options())
         
         return out_img_path
+
+    def make_meme_buffer(self, img_path: str, text: str, author: str, width=500,
+                         font_path: str = None, font_size: int = None, buffer=None):
+        """Manipulate the given image and encode it as a JPEG in memory, without writing a file.
+        
+            Arguments:
+                img_path {str} -- the file location or a file object for the input image.
+                text {str} -- the text which is the quote body to add to the image
+                author {str} -- the author of the quote and need to add to the image
+                width {int} -- the desired width of the output image
+                font_path {str} -- the font file of the caption, the generator's by default
+                font_size {int} -- the largest font size of the caption, the generator's by default
+                buffer {BytesIO} -- the buffer to write into, a new one by default
+            
+            Return:
+                the buffer holding the encoded image, positioned at its start.
+
+            Raises:
+                FileNotFoundError -- when the input image does not exist.
+        """
+        buffer = buffer if buffer is not None else BytesIO()
+        # reuse the bytes of an identical meme cached on disk if any
+        if self.render_cache is not None and isinstance(img_path, str):
+            cached_path = self.render_cache.get(
+                self.cache_key(img_path, text, author, width, font_path, font_size))
+            if cached_path is not None:
+                with open(cached_path, 'rb') as file:
+                    shutil.copyfileobj(file, buffer)
+                buffer.seek(0)
+                return buffer
+
+        img = self.render(img_path, text, author, width, font_path, font_size)
+        with stage_seconds.time('encode'):
+            img.save(buffer, format='JPEG', **self.save_options())
+        buffer.seek(0)
+        return buffer
+    def render_variants(self, img_path: str, text: str, author: str,
+                        variants=DEFAULT_VARIANTS, font_path: str = None,
+                        font_size: int = None) -> list:
+        """Render a meme once and save it in several widths and formats.
+
+        The caption is drawn once on the widest variant and the smaller variants are
+        scaled down from it, so the text and its placement are the same in all of them.
+        
+            Arguments:
+                img_path {str} -- the file location or a file object for the input image.
+                text {str} -- the text which is the quote body to add to the image
+                author {str} -- the author of the quote and need to add to the image
+                variants {list} -- the (width, format) of every output, e.g. (150, 'WEBP')
+                font_path {str} -- the font file of the caption, the generator's by default
+                font_size {int} -- the largest font size of the caption, the generator's by default
+            
+            Return:
+                the manifest of the outputs, a dict with the width, height, format and
+                path of every variant in the order of the variants.
+        """
+        variants = [(width, format.upper()) for width, format in variants]
+        base_width = max(width for width, _ in variants)
+        suffixes = [f"-{width}{EXTENSIONS[format]}" for width, format in variants]
+
+        """Look up the rendered variants
+        """
+        cache_key = None
+        try:
+            if self.render_cache is not None and isinstance(img_path, str):
+                cache_key = self.cache_key(img_path, text, author, base_width, font_path, font_size)
+                cached_paths = [self.render_cache.get(cache_key, suffix) for suffix in suffixes]
+                # the variants are only reused together, so their captions always match
+                if all(cached_paths):
+                    # the heights follow from the size of the source image, the variants are not opened
+                    stat = os.stat(img_path)
+                    base_height = scaled_height(source_size(os.path.abspath(img_path), stat.st_mtime_ns),
+                                                base_width)
+                    return [self._manifest_entry(path, width, format,
+                                                 self._variant_height(base_width, base_height, width))
+                            for path, (width, format) in zip(cached_paths, variants)]
+
+            img = self.render(img_path, text, author, base_width, font_path, font_size)
+        except FileNotFoundError:
+            print(f"File {img_path} is not found")
+            return None
+
+        """Save every variant
+        """
+        if cache_key is not None:
+            base_name = cache_key
+        else:
+            base_name = unique_file_name('')
+
+        # scale each width down from the captioned image once, whatever its formats
+        resized = {base_width: img}
+        manifest = []
+        for (width, format), suffix in zip(variants, suffixes):
+            if width not in resized:
+                height = self._variant_height(img.width, img.height, width)
+                with stage_seconds.time('resize'):
+                    resized[width] = img.resize((width, height), resample=self.resample,
+                                                reducing_gap=self.reducing_gap)
+            if cache_key is not None:
+                out_img_path = self.render_cache.path_for(cache_key, suffix)
+                atomic_save(resized[width], out_img_path, format=format, **self.save_options(format))
+                self.render_cache.add(cache_key, suffix)
+            else:
+                # the variants of the meme share a shard
+                out_img_path = self.output_store.save(resized[width], base_name + suffix, key=base_name,
+                                                      format=format, **self.save_options(format))
+            manifest.append(self._manifest_entry(out_img_path, width, format,
+                                                 resized[width].height))
+        return manifest
+
+    @staticmethod
+    def _variant_height(base_width: int, base_height: int, width: int) -> int:
+        """Return the height of a variant scaled down from the captioned image."""
+        if width == base_width:
+            return base_height
+        return max(1, int(base_height * width / float(base_width)))
+
+    @staticmethod
+    def _manifest_entry(path: str, width: int, format: str, height: int) -> dict:
+        """Describe an output variant."""
+        return {'width': width, 'height': height, 'format': format, 'path': path}
+
     # def make_meme(self, img_path: str, text: str, author: str, width=500) -> str:
     #     """Manipulate the given image.
         
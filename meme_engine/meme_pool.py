@@ -0,0 +1,90 @@
+"""The module renders random memes ahead of time, so they are ready when they are asked for."""
+import os
+import threading
+from collections import deque
+
+
+class MemePool:
+    """A bounded buffer of ready-made random memes, refilled by a background producer.
+
+    The producer renders a meme whenever the buffer is not full, and sleeps otherwise.
+    Taking a meme never waits for a render: it returns None when the buffer is empty,
+    and the caller falls back to rendering one itself.
+    """
+
+    def __init__(self, produce, size: int = 8):
+        """Initialize an empty pool.
+
+            Arguments:
+                produce {callable} -- called without arguments in the background to render
+                    a random meme, it returns the manifest of its variants or None.
+                size {int} -- the number of memes kept ready.
+        """
+        self.produce = produce
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._memes = deque(maxlen=size)
+        self._wanted = threading.Condition()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start filling the pool in a daemon thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._fill, name='meme-pool', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the producer once its current render is finished."""
+        self._stopped.set()
+        with self._wanted:
+            self._wanted.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def take(self):
+        """Pop a ready-made meme.
+
+            Returns:
+                the manifest of the meme, or None if the pool is empty.
+        """
+        with self._wanted:
+            while self._memes:
+                variants = self._memes.popleft()
+                # wake the producer up to replace the meme
+                self._wanted.notify()
+                # the rendered files may have been evicted from the cache meanwhile
+                if all(os.path.exists(variant['path']) for variant in variants):
+                    self.hits += 1
+                    return variants
+            self.misses += 1
+            return None
+
+    def __len__(self):
+        """Return the number of memes ready."""
+        return len(self._memes)
+
+    def _fill(self):
+        """Render memes until the pool is full, then wait until one is taken."""
+        while not self._stopped.is_set():
+            with self._wanted:
+                while len(self._memes) >= self.size and not self._stopped.is_set():
+                    self._wanted.wait()
+            if self._stopped.is_set():
+                return
+            # render outside the lock, so taking a meme never waits for a render
+            try:
+                variants = self.produce()
+            except Exception as e:
+                print(f"There is error \"{str(e)}\" when pre-rendering a meme")
+                variants = None
+            if not variants:
+                # avoid a busy loop while the images are missing
+                self._stopped.wait(1.0)
+                continue
+            with self._wanted:
+                self._memes.append(variants)
@@ -0,0 +1,418 @@
+"""The module names and writes the generated memes on disk, and bounds the disk they use."""
+import os
+import time
+import hashlib
+import itertools
+import secrets
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from io import BytesIO
+from time_utils import get_current_time
+from metrics import stage_seconds
+
+try:
+    import fcntl
+except ImportError:
+    # e.g. on Windows, where the index is only safe to share between the threads of a process
+    fcntl = None
+
+# a counter of the names generated by this process
+_name_counter = itertools.count()
+
+
+def unique_file_name(extension: str = '.jpg') -> str:
+    """Generate a file name which cannot collide across threads and processes.
+
+    The name combines the current time, the process id, a per-process counter and
+    a random token, so memes created within the same second never overwrite each other.
+
+        Arguments:
+            extension {str} -- the extension of the file, including the dot.
+
+        Returns:
+            the file name.
+    """
+    # next() on itertools.count is atomic, so threads never share a number
+    return f"{get_current_time()}-{os.getpid()}-{next(_name_counter)}-{secrets.token_hex(4)}{extension}"
+
+
+def atomic_save(img, out_img_path: str, **save_kwargs):
+    """Save the image into a temporary file then rename it to the given path.
+
+    Readers never see a partially written image, and the rename needs no lock.
+
+        Arguments:
+            img {Image} -- the image to save.
+            out_img_path {str} -- the final file location of the image.
+            save_kwargs -- the extra arguments of Image.save, e.g. quality.
+    """
+    # encode in memory first, so that the encoding and the writing are timed apart
+    with stage_seconds.time('encode'):
+        buffer = BytesIO()
+        # the format cannot be guessed from a buffer
+        save_kwargs.setdefault('format', _format_of(out_img_path))
+        img.save(buffer, **save_kwargs)
+
+    with stage_seconds.time('write'):
+        out_dir = os.path.dirname(out_img_path) or '.'
+        # the temporary file must be on the same file system for the rename to be atomic
+        fd, tmp_path = tempfile.mkstemp(dir=out_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(buffer.getbuffer())
+            # mkstemp only lets the owner read the file, but the memes are served publicly
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, out_img_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+
+def _format_of(path: str) -> str:
+    """Return the Pillow format name matching the extension of the path."""
+    extension = os.path.splitext(path)[1].lower()
+    return {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.webp': 'WEBP'}.get(extension, 'JPEG')
+
+
+class OutputStore:
+    """The directory of the generated memes, bounded by a background janitor.
+
+    The memes are sharded into 256 subdirectories named after a hash of their name, so that
+    no directory grows too large. When a limit is given, every meme is recorded in an
+    append-only index, and a janitor thread deletes the oldest memes beyond the maximum
+    file count or byte budget, and those older than the maximum age.
+    The index is replayed on start, so the tree is never rescanned after the first time.
+
+    The index can be shared by several processes, e.g. the workers of a WSGI server:
+    it is only written under an exclusive lock of a sidecar file, and every process
+    replays the lines the others appended before it writes, so the limits hold for
+    the memes of all the processes together.
+    """
+
+    # the name of the index file in the root directory when no index path is given
+    index_name = '.output_index'
+
+    def __init__(self, root: str, max_files: int = None, max_bytes: int = None,
+                 max_age: float = None, interval: float = 60.0, index_path: str = None):
+        """Initialize the store, loading its index if it is bounded.
+
+            Arguments:
+                root {str} -- the directory to save the memes into.
+                max_files {int} -- the maximum number of memes, unlimited by default.
+                max_bytes {int} -- the disk quota of the memes, unlimited by default.
+                max_age {float} -- the seconds a meme is kept after its creation, forever by default.
+                interval {float} -- the seconds between two rounds of the janitor.
+                index_path {str} -- the location of the index, in the root directory by default;
+                    it should be outside of it when the root is served publicly.
+        """
+        self.root = root
+        self.index_path = index_path or os.path.join(root, self.index_name)
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.interval = interval
+        self.current_bytes = 0
+        self.evictions = 0
+        # the memes (relative path -> (size, creation time)) ordered from the oldest
+        self._entries = OrderedDict()
+        self._journal = None
+        self._journal_lines = 0
+        # the index file replayed so far, by its inode and the bytes read from it
+        self._inode = None
+        self._offset = 0
+        self._lock_file = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        if self.bounded:
+            self._load_index()
+
+    @property
+    def bounded(self) -> bool:
+        """Whether the store has any limit, and so keeps an index."""
+        return any(limit is not None for limit in (self.max_files, self.max_bytes, self.max_age))
+
+    def path_for(self, file_name: str, key: str = None, create: bool = True) -> str:
+        """Return the location of a meme in its shard, creating the shard if needed.
+
+            Arguments:
+                file_name {str} -- the name of the meme file.
+                key {str} -- the string hashed to pick the shard, the file name by default;
+                    the variants of a meme share their key to stay together.
+                create {bool} -- whether to create the shard, which a lookup does not need.
+        """
+        shard = hashlib.md5((key or file_name).encode('utf-8')).hexdigest()[:2]
+        shard_dir = os.path.join(self.root, shard)
+        if create:
+            os.makedirs(shard_dir, exist_ok=True)
+        return os.path.join(shard_dir, file_name)
+
+    def save(self, img, file_name: str, key: str = None, **save_kwargs) -> str:
+        """Save an image atomically into its shard and record it in the index.
+
+            Returns:
+                the file location of the image.
+        """
+        out_img_path = self.path_for(file_name, key)
+        atomic_save(img, out_img_path, **save_kwargs)
+        self.add(out_img_path)
+        return out_img_path
+
+    def add(self, path: str):
+        """Record a meme which has just been written under the root directory."""
+        if not self.bounded:
+            return
+        name = os.path.relpath(path, self.root)
+        size = os.path.getsize(path)
+        created = time.time()
+        with self._exclusive():
+            # the lines of the other processes come first, so that this one is not replayed twice
+            self._sync()
+            self._forget(name)
+            self._entries[name] = (size, created)
+            self.current_bytes += size
+            self._append(f"+\t{name}\t{size}\t{created}\n")
+            over_budget = self._over_budget()
+        if over_budget:
+            # the janitor deletes the extra memes off the request path
+            self._wake.set()
+
+    def remove(self, path: str):
+        """Delete a meme under the root directory and record its removal in the index."""
+        if self.bounded:
+            name = os.path.relpath(path, self.root)
+            with self._exclusive():
+                self._sync()
+                if name in self._entries:
+                    self._forget(name)
+                    self._append(f"-\t{name}\n")
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def enforce(self) -> int:
+        """Delete the expired memes, then the oldest ones beyond the limits.
+
+        The memes of all the processes sharing the index count towards the limits,
+        and a meme is only deleted by the first janitor which picks it.
+
+            Returns:
+                the number of memes deleted.
+        """
+        victims = []
+        with self._exclusive():
+            self._sync()
+            if self.max_age is not None:
+                expire_before = time.time() - self.max_age
+                for name, (_, created) in self._entries.items():
+                    if created >= expire_before:
+                        # the rest of the memes are more recent
+                        break
+                    victims.append(name)
+                for name in victims:
+                    self._forget(name)
+            while self._over_budget():
+                name = next(iter(self._entries))
+                self._forget(name)
+                victims.append(name)
+            for name in victims:
+                self._append(f"-\t{name}\n")
+            self.evictions += len(victims)
+            # rewrite the index when it is mostly made of removed memes
+            if self._journal_lines > 2 * len(self._entries) + 1000:
+                self._compact()
+
+        # delete the files outside the lock, so that the memes are still recorded meanwhile
+        for name in victims:
+            try:
+                os.remove(os.path.join(self.root, name))
+            except FileNotFoundError:
+                pass
+        return len(victims)
+
+    def start(self):
+        """Start the janitor in a daemon thread, if the store is bounded."""
+        if not self.bounded or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='output-janitor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the janitor and close the index."""
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            for file in (self._journal, self._lock_file):
+                if file is not None:
+                    file.close()
+            self._journal = None
+            self._lock_file = None
+
+    def __len__(self):
+        """Return the number of memes recorded, as of the last write of this process."""
+        return len(self._entries)
+
+    def _run(self):
+        """Enforce the limits every interval, or as soon as a meme exceeds them."""
+        while not self._stopped.is_set():
+            try:
+                self.enforce()
+            except OSError as e:
+                print(f"There is error \"{str(e)}\" when deleting the old memes of {self.root}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    @contextmanager
+    def _exclusive(self):
+        """Hold the lock of the index against the other threads and the other processes."""
+        with self._lock:
+            lock_file = None
+            if fcntl is not None:
+                try:
+                    if self._lock_file is None:
+                        os.makedirs(os.path.dirname(self.index_path) or '.', exist_ok=True)
+                        # the index itself is replaced when it is compacted, so it cannot hold the lock
+                        self._lock_file = open(self.index_path + '.lock', 'a')
+                    lock_file = self._lock_file
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                except OSError as e:
+                    print(f"There is error \"{str(e)}\" when locking the index of {self.root}")
+                    lock_file = None
+            try:
+                yield
+            finally:
+                if lock_file is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _over_budget(self) -> bool:
+        """Whether there are too many memes; the caller must hold the lock."""
+        return bool(self._entries) and (
+            (self.max_files is not None and len(self._entries) > self.max_files)
+            or (self.max_bytes is not None and self.current_bytes > self.max_bytes))
+
+    def _forget(self, name: str):
+        """Remove a meme from the index in memory only; the caller must hold the lock."""
+        entry = self._entries.pop(name, None)
+        if entry is not None:
+            self.current_bytes -= entry[0]
+
+    def _replay(self, line: str):
+        """Apply a line of the index to the memes in memory; the caller must hold the lock."""
+        self._journal_lines += 1
+        fields = line.split('\t')
+        try:
+            if fields[0] == '+':
+                self._forget(fields[1])
+                self._entries[fields[1]] = (int(fields[2]), float(fields[3]))
+                self.current_bytes += int(fields[2])
+            elif fields[0] == '-':
+                self._forget(fields[1])
+        except (IndexError, ValueError):
+            # e.g. a line cut short by a crash
+            pass
+
+    def _sync(self):
+        """Replay the lines appended to the index by the other processes; the caller must hold the lock."""
+        try:
+            file = open(self.index_path, 'rb')
+        except FileNotFoundError:
+            # the index was deleted meanwhile, it is written again from the memes in memory
+            self._compact()
+            return
+        except OSError as e:
+            print(f"There is error \"{str(e)}\" when reading the index of {self.root}")
+            return
+        with file:
+            inode = os.fstat(file.fileno()).st_ino
+            if inode != self._inode:
+                # another process compacted the index, which is replayed from its start
+                if self._journal is not None:
+                    self._journal.close()
+                    self._journal = None
+                self._entries.clear()
+                self.current_bytes = 0
+                self._journal_lines = 0
+                self._inode = inode
+                self._offset = 0
+            file.seek(self._offset)
+            data = file.read()
+        # a last line without its end of line was cut short by a crash, _append() terminates it
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].decode('utf-8', 'replace').splitlines():
+            self._replay(line)
+        self._offset += end
+
+    def _append(self, line: str):
+        """Append a line to the index; the caller must hold the lock and have synced the index."""
+        data = line.encode('utf-8')
+        try:
+            if self._journal is None:
+                os.makedirs(os.path.dirname(self.index_path) or '.', exist_ok=True)
+                self._journal = open(self.index_path, 'ab')
+            size = os.fstat(self._journal.fileno()).st_size
+            if size > self._offset:
+                # the unread bytes are a line cut short by a crash
+                data = b'\n' + data
+            self._journal.write(data)
+            self._journal.flush()
+            self._offset = size + len(data)
+            self._journal_lines += 1
+        except OSError as e:
+            print(f"There is error \"{str(e)}\" when writing the index of {self.root}")
+
+    def _load_index(self):
+        """Replay the index, or build it from the shards the first time."""
+        with self._exclusive():
+            if os.path.exists(self.index_path):
+                self._sync()
+                return
+
+            # the first process to start scans the shards, the others replay its index
+            if os.path.isdir(self.root):
+                # only the shards belong to the store, the other files of the root are left alone
+                found = []
+                with os.scandir(self.root) as shards:
+                    for shard in shards:
+                        if not (shard.is_dir() and len(shard.name) == 2 and
+                                all(c in '0123456789abcdef' for c in shard.name)):
+                            continue
+                        with os.scandir(shard.path) as files:
+                            for entry in files:
+                                if entry.is_file() and not entry.name.endswith('.tmp'):
+                                    stat = entry.stat()
+                                    found.append((stat.st_mtime, os.path.join(shard.name, entry.name),
+                                                  stat.st_size))
+                for created, name, size in sorted(found):
+                    self._entries[name] = (size, created)
+                    self.current_bytes += size
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the index with the current memes only; the caller must hold the lock and have synced the index."""
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        try:
+            directory = os.path.dirname(self.index_path) or '.'
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                for name, (size, created) in self._entries.items():
+                    file.write(f"+\t{name}\t{size}\t{created}\n")
+                file.flush()
+                stat = os.fstat(file.fileno())
+            os.replace(tmp_path, self.index_path)
+            # the other processes notice the new inode and replay it from its start
+            self._inode = stat.st_ino
+            self._offset = stat.st_size
+            self._journal_lines = len(self._entries)
+        except OSError as e:
+            print(f"There is error \"{str(e)}\" when writing the index of {self.root}")
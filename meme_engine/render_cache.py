@@ -0,0 +1,169 @@
+"""The module keeps the rendered memes on disk so identical memes are never rendered twice."""
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from meme_engine.output_store import OutputStore
+
+# the file names of the cached memes start with the 64 hexadecimal digits of their key
+_KEY_PATTERN = re.compile(r'[0-9a-f]{64}[-.]')
+
+
+class RenderCache:
+    """A content-addressed cache of rendered memes in the shards of an OutputStore.
+
+    Each meme is named after a hash of its inputs and of the source image's size and mtime,
+    followed by a suffix such as ".jpg" or "-150.webp" for the variants of the same meme,
+    which share the shard of their key. The memes are recorded in the index of the store,
+    so a bounded store counts them in its file count and disk quota across all the processes.
+    The cache itself can also be bounded by a disk quota, evicting the least recently used
+    memes first, and by a maximum age since the last use.
+    """
+
+    # the suffix of the cached memes when none is given
+    extension = '.jpg'
+
+    def __init__(self, cache_dir, max_bytes: int = 256 * 1024 * 1024, max_age: float = None):
+        """Initialize the cache.
+
+            Arguments:
+                cache_dir {str or OutputStore} -- the directory to store the rendered memes into,
+                    or the OutputStore which shards the directory and bounds its size.
+                max_bytes {int} -- the disk quota of the cached memes of this process, none when
+                    the store is bounded instead.
+                max_age {float} -- the seconds a meme is kept after its last use, forever by default.
+        """
+        self.output_store = cache_dir if isinstance(cache_dir, OutputStore) else OutputStore(cache_dir)
+        self.cache_dir = self.output_store.root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        # the cached memes (file name -> size) ordered from the least to the most recently used
+        self._entries = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(img_path: str, text: str, author: str, width: int,
+                 font_path: str, font_size: int, options: tuple = ()) -> str:
+        """Hash the inputs of a meme together with the state of its source image.
+
+        The options are any other settings which change the output, e.g. the JPEG quality.
+
+            Returns:
+                the hexadecimal key of the meme.
+        """
+        # raise FileNotFoundError for a missing image like a render would
+        stat = os.stat(img_path)
+        inputs = (os.path.abspath(img_path), stat.st_size, stat.st_mtime_ns,
+                  text, author, width, font_path, font_size, options)
+        return hashlib.sha256(repr(inputs).encode('utf-8')).hexdigest()
+
+    def path_for(self, key: str, suffix: str = None) -> str:
+        """Return the file location of the meme with the given key and suffix, creating its shard."""
+        return self.output_store.path_for(key + (suffix or self.extension), key=key)
+
+    def _path_of(self, name: str) -> str:
+        """Return the file location of a cached meme from its file name, without creating its shard."""
+        # the variants of a meme share the shard of its key
+        return self.output_store.path_for(name, key=name[:64], create=False)
+
+    def get(self, key: str, suffix: str = None):
+        """Look up a rendered meme.
+
+            Returns:
+                the file location of the meme, or None if it must be rendered.
+        """
+        name = key + (suffix or self.extension)
+        path = self._path_of(name)
+        with self._lock:
+            self._load_entries()
+            # another process may have rendered or evicted the meme meanwhile
+            if not os.path.exists(path):
+                self.misses += 1
+                self._forget(name)
+                return None
+            if self.max_age is not None and time.time() - os.path.getmtime(path) > self.max_age:
+                self.misses += 1
+                self._evict(name)
+                return None
+            self.hits += 1
+            if name not in self._entries:
+                self._entries[name] = os.path.getsize(path)
+                self.current_bytes += self._entries[name]
+            self._entries.move_to_end(name)
+        # the mtime records the last use, so the order survives a restart
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def add(self, key: str, suffix: str = None):
+        """Record a meme which has just been written to path_for(key, suffix), then enforce the quota."""
+        name = key + (suffix or self.extension)
+        path = self._path_of(name)
+        size = os.path.getsize(path)
+        # the store bounds the cached memes together with the other memes of the app
+        self.output_store.add(path)
+        with self._lock:
+            self._load_entries()
+            self._forget(name)
+            self._entries[name] = size
+            self.current_bytes += size
+            self._enforce_quota()
+
+    def _load_entries(self):
+        """Index the memes already in the shards once; the caller must hold the lock."""
+        if self._entries is not None:
+            return
+        self._entries = OrderedDict()
+        if not os.path.isdir(self.cache_dir):
+            return
+        found = []
+        with os.scandir(self.cache_dir) as shards:
+            for shard in shards:
+                if not (shard.is_dir() and len(shard.name) == 2 and
+                        all(c in '0123456789abcdef' for c in shard.name)):
+                    continue
+                with os.scandir(shard.path) as files:
+                    for entry in files:
+                        # only the content-addressed memes belong to the cache
+                        if not _KEY_PATTERN.match(entry.name) or entry.name.endswith('.tmp'):
+                            continue
+                        stat = entry.stat()
+                        found.append((stat.st_mtime, entry.name, stat.st_size))
+        # the least recently used memes first
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+            self.current_bytes += size
+        self._enforce_quota()
+
+    def _enforce_quota(self):
+        """Evict the expired and the least recently used memes; the caller must hold the lock."""
+        if self.max_age is not None:
+            expire_before = time.time() - self.max_age
+            for name in list(self._entries):
+                try:
+                    if os.path.getmtime(self._path_of(name)) >= expire_before:
+                        # the rest of the memes were used more recently
+                        break
+                except OSError:
+                    pass
+                self._evict(name)
+        while self.max_bytes is not None and self.current_bytes > self.max_bytes and self._entries:
+            self._evict(next(iter(self._entries)))
+
+    def _evict(self, name: str):
+        """Delete a cached meme and its line of the index of the store; the caller must hold the lock."""
+        self._forget(name)
+        self.output_store.remove(self._path_of(name))
+
+    def _forget(self, name: str):
+        """Remove a meme from the index only; the caller must hold the lock."""
+        size = self._entries.pop(name, None)
+        if size is not None:
+            self.current_bytes -= size
@@ -0,0 +1,322 @@
+"""The module renders the memes in background workers, tracked by job ids."""
+import json
+import time
+import uuid
+import queue
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+# the states of a job
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class QueueFullError(Exception):
+    """Raised when too many jobs are waiting to be rendered."""
+
+
+class RenderJob:
+    """A request to render a meme, and its outcome once rendered."""
+
+    def __init__(self, job_id: str, key: str, params: dict, status: str = QUEUED,
+                 result=None, error: str = None, created: float = None):
+        """Initialize the job.
+
+            Arguments:
+                job_id {str} -- the id returned to the client.
+                key {str} -- the hash of the params, identical jobs have the same key.
+                params {dict} -- the JSON serializable inputs of the render function.
+                status {str} -- one of queued, running, done and failed.
+                result -- the JSON serializable output of the render function once done.
+                error {str} -- the error which failed the job if any.
+                created {float} -- the time the job was submitted at.
+        """
+        self.id = job_id
+        self.key = key
+        self.params = params
+        self.status = status
+        self.result = result
+        self.error = error
+        self.created = created if created is not None else time.time()
+
+    @property
+    def finished(self) -> bool:
+        """Whether the job is done or failed."""
+        return self.status in (DONE, FAILED)
+
+    def to_dict(self) -> dict:
+        """Return the public state of the job."""
+        return {'id': self.id, 'status': self.status, 'result': self.result, 'error': self.error}
+
+
+class SQLiteJobStore:
+    """Persist the jobs in a local SQLite database, so the queued jobs survive a restart.
+
+    The store can be shared by several processes, e.g. the workers of a WSGI server:
+    a job is claimed by a single worker with an atomic update before it is rendered,
+    and the claim of a worker which died expires after a lease.
+    """
+
+    # the columns of a job, in the order of the arguments of RenderJob
+    columns = 'id, key, params, status, result, error, created'
+
+    def __init__(self, path: str):
+        """Initialize the store, creating the database if needed.
+
+            Arguments:
+                path {str} -- the file of the database.
+        """
+        self.path = path
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                               'id TEXT PRIMARY KEY, key TEXT, params TEXT, status TEXT, '
+                               'result TEXT, error TEXT, created REAL, claimed REAL)')
+            try:
+                # the time of the claim, missing from the databases of the former version
+                connection.execute('ALTER TABLE jobs ADD COLUMN claimed REAL')
+            except sqlite3.OperationalError:
+                pass
+
+    def _connect(self):
+        """Open a connection; one per operation keeps the store safe across threads."""
+        return sqlite3.connect(self.path, timeout=10)
+
+    def add(self, job: RenderJob):
+        """Insert a new job, unless a worker already claimed it."""
+        with self._connect() as connection:
+            self._insert(connection, job)
+
+    def save(self, job: RenderJob):
+        """Insert or update the state of a job."""
+        with self._connect() as connection:
+            connection.execute(f'INSERT INTO jobs ({self.columns}) VALUES (?, ?, ?, ?, ?, ?, ?) '
+                               'ON CONFLICT(id) DO UPDATE SET status = excluded.status, '
+                               'result = excluded.result, error = excluded.error',
+                               self._to_row(job))
+
+    def claim(self, job: RenderJob) -> bool:
+        """Mark a queued job as running, unless another worker of any process claimed it first.
+
+            Returns:
+                True if the job is claimed by the caller, which must render it.
+        """
+        with self._connect() as connection:
+            # the job may be claimed before its submission is saved
+            self._insert(connection, job)
+            cursor = connection.execute('UPDATE jobs SET status = ?, claimed = ? WHERE id = ? AND status = ?',
+                                        (RUNNING, time.time(), job.id, QUEUED))
+            return cursor.rowcount == 1
+
+    def load(self, job_id: str):
+        """Return the job with the given id, or None."""
+        with self._connect() as connection:
+            row = connection.execute(f'SELECT {self.columns} FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._to_job(row) if row else None
+
+    def unfinished(self, lease: float) -> list:
+        """Return the queued jobs, oldest first.
+
+        The running jobs claimed more than lease seconds ago are queued again first,
+        their worker having died, e.g. in a restart.
+        """
+        with self._connect() as connection:
+            connection.execute('UPDATE jobs SET status = ? WHERE status = ? AND (claimed IS NULL OR claimed < ?)',
+                               (QUEUED, RUNNING, time.time() - lease))
+            rows = connection.execute(f'SELECT {self.columns} FROM jobs WHERE status = ? ORDER BY created',
+                                      (QUEUED,)).fetchall()
+        return [self._to_job(row) for row in rows]
+
+    def _insert(self, connection, job: RenderJob):
+        """Insert a job if it is not in the database yet."""
+        connection.execute(f'INSERT OR IGNORE INTO jobs ({self.columns}) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                           self._to_row(job))
+
+    @staticmethod
+    def _to_row(job: RenderJob) -> tuple:
+        """Return the values of the columns of a job."""
+        return (job.id, job.key, json.dumps(job.params), job.status,
+                json.dumps(job.result), job.error, job.created)
+
+    @staticmethod
+    def _to_job(row) -> RenderJob:
+        """Build a job from a row of the jobs table."""
+        job_id, key, params, status, result, error, created = row
+        return RenderJob(job_id, key, json.loads(params), status, json.loads(result), error, created)
+
+
+class RenderQueue:
+    """A bounded queue of render jobs, run by a pool of worker threads.
+
+    Identical jobs which are in flight at the same time are only rendered once,
+    and a submission is refused with QueueFullError when too many jobs are waiting.
+    With a store, the unfinished jobs are resumed in the background, and a job is
+    claimed in the store before it is rendered, so that the processes sharing the
+    store render every job once.
+    """
+
+    def __init__(self, render, max_workers: int = 4, max_pending: int = 32,
+                 max_finished: int = 1000, store: SQLiteJobStore = None,
+                 lease: float = 300.0, sweep_interval: float = 60.0):
+        """Initialize the queue and start the workers.
+
+            Arguments:
+                render {callable} -- called as render(**params) in a worker, it returns
+                    the JSON serializable result of a job.
+                max_workers {int} -- the number of worker threads.
+                max_pending {int} -- the maximum number of queued jobs.
+                max_finished {int} -- the number of finished jobs kept in memory for status lookups.
+                store {SQLiteJobStore} -- the store which persists the jobs, none by default.
+                lease {float} -- the seconds after which the claim of a running job expires,
+                    much longer than a render.
+                sweep_interval {float} -- the seconds between two lookups of the unfinished jobs of the store.
+        """
+        self.render = render
+        self.max_finished = max_finished
+        self.store = store
+        self.lease = lease
+        self.sweep_interval = sweep_interval
+        self._pending = queue.Queue(maxsize=max_pending)
+        # all the jobs by id, the finished ones are evicted oldest first
+        self._jobs = OrderedDict()
+        # the key -> the id of the job in flight, to deduplicate submissions
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+        self._workers = [threading.Thread(target=self._work, name=f'render-worker-{i}', daemon=True)
+                         for i in range(max_workers)]
+        for worker in self._workers:
+            worker.start()
+
+        # resume the jobs which were not finished before a restart, once the workers make room
+        # in the queue, so that more unfinished jobs than max_pending never block the start
+        self._sweeper = None
+        if store is not None:
+            self._sweeper = threading.Thread(target=self._sweep, name='render-sweeper', daemon=True)
+            self._sweeper.start()
+
+    @staticmethod
+    def make_key(params: dict) -> str:
+        """Hash the params of a job, identical jobs have the same key."""
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def submit(self, params: dict) -> str:
+        """Queue a job, or join an identical job in flight.
+
+            Returns:
+                the id of the job.
+
+            Raises:
+                QueueFullError -- when the queue is full.
+        """
+        key = self.make_key(params)
+        with self._lock:
+            job_id = self._in_flight.get(key)
+            if job_id is not None:
+                return job_id
+
+            job = RenderJob(uuid.uuid4().hex, key, params)
+            try:
+                self._pending.put_nowait(job)
+            except queue.Full:
+                raise QueueFullError(f"{self._pending.maxsize} memes are already waiting to be rendered")
+            self._jobs[job.id] = job
+            self._in_flight[key] = job.id
+        if self.store is not None:
+            try:
+                # never overwrites the state of a worker which claimed the job meanwhile
+                self.store.add(job)
+            except sqlite3.Error as e:
+                print(f"There is error \"{str(e)}\" when saving the render job {job.id}")
+        return job.id
+
+    def get(self, job_id: str):
+        """Return the job with the given id, or None if it is unknown."""
+        job = self._jobs.get(job_id)
+        if (job is None or not job.finished) and self.store is not None:
+            # another process sharing the store may have claimed and rendered the job
+            try:
+                job = self.store.load(job_id) or job
+            except sqlite3.Error as e:
+                print(f"There is error \"{str(e)}\" when loading the render job {job_id}")
+        return job
+
+    def pending(self) -> int:
+        """Return the number of queued jobs."""
+        return self._pending.qsize()
+
+    def _work(self):
+        """Run the queued jobs one after the other, forever."""
+        while True:
+            job = self._pending.get()
+            if not self._claim(job):
+                # another process rendered or is rendering the job, its state is read from the store
+                with self._lock:
+                    self._jobs.pop(job.id, None)
+                    self._forget_in_flight(job)
+                self._pending.task_done()
+                continue
+            job.status = RUNNING
+            try:
+                job.result = self.render(**job.params)
+                job.status = DONE
+            except Exception as e:
+                job.error = str(e)
+                job.status = FAILED
+            with self._lock:
+                self._forget_in_flight(job)
+                self._evict_finished()
+            self._save(job)
+            self._pending.task_done()
+
+    def _sweep(self):
+        """Queue the unfinished jobs of the store which this process does not know, forever."""
+        while True:
+            try:
+                jobs = self.store.unfinished(self.lease)
+            except sqlite3.Error as e:
+                print(f"There is error \"{str(e)}\" when loading the unfinished render jobs")
+                jobs = []
+            for job in jobs:
+                with self._lock:
+                    if job.id in self._jobs:
+                        # already queued or rendered by this process
+                        continue
+                    self._jobs[job.id] = job
+                    self._in_flight.setdefault(job.key, job.id)
+                # wait for room in the queue, the submissions are refused meanwhile
+                self._pending.put(job)
+            time.sleep(self.sweep_interval)
+
+    def _claim(self, job: RenderJob) -> bool:
+        """Claim the job in the store before rendering it, if there is a store."""
+        if self.store is None:
+            return True
+        try:
+            return self.store.claim(job)
+        except sqlite3.Error as e:
+            # render the job anyway rather than lose it
+            print(f"There is error \"{str(e)}\" when claiming the render job {job.id}")
+            return True
+
+    def _forget_in_flight(self, job: RenderJob):
+        """Let the next identical submission be a new job; the caller must hold the lock."""
+        if self._in_flight.get(job.key) == job.id:
+            del self._in_flight[job.key]
+
+    def _evict_finished(self):
+        """Forget the oldest finished jobs; the caller must hold the lock."""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def _save(self, job: RenderJob):
+        """Persist the job if there is a store."""
+        if self.store is not None:
+            try:
+                self.store.save(job)
+            except sqlite3.Error as e:
+                print(f"There is error \"{str(e)}\" when saving the render job {job.id}")
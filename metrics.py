@@ -0,0 +1,206 @@
+"""Collect timing histograms and counters in the process, and export them in the Prometheus text format."""
+import time
+import threading
+from bisect import bisect_left
+
+# the upper bounds in seconds of the buckets of the timing histograms
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    """Format the labels of a sample, e.g. {stage="decode",le="0.1"}."""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    """Escape a label value of the text format."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    """Format a sample value, without a trailing .0 for the integers."""
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Timer:
+    """Time the code of a with block into a histogram."""
+
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram, labels: tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+class Histogram:
+    """The distribution of a value, e.g. durations, in cumulative buckets per set of labels."""
+
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, label_names: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        """Initialize an empty histogram.
+
+            Arguments:
+                name {str} -- the name of the metric.
+                help {str} -- the description of the metric.
+                label_names {tuple} -- the names of the labels, given as values to observe().
+                buckets {tuple} -- the sorted upper bounds of the buckets.
+        """
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # the label values -> [the count of every bucket and of +Inf, the sum, the count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        """Record a value for the given label values."""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, *labels) -> _Timer:
+        """Return a context manager which records the seconds spent in its block."""
+        return _Timer(self, labels)
+
+    def samples(self):
+        """Yield the (suffix, labels, value) samples of the text format."""
+        with self._lock:
+            series = [(labels, list(counts), total, count)
+                      for labels, (counts, total, count) in self._series.items()]
+        for labels, counts, total, count in sorted(series):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield '_bucket', _format_labels(self.label_names, labels, f'le="{le}"'), cumulative
+            yield '_sum', _format_labels(self.label_names, labels), total
+            yield '_count', _format_labels(self.label_names, labels), count
+
+
+class Counter:
+    """A count which only goes up, per set of labels."""
+
+    type = 'counter'
+
+    def __init__(self, name: str, help: str, label_names: tuple = ()):
+        """Initialize the counter at zero.
+
+            Arguments:
+                name {str} -- the name of the metric, ending with _total by convention.
+                help {str} -- the description of the metric.
+                label_names {tuple} -- the names of the labels, given as values to inc().
+        """
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        """Add the amount to the count of the given label values."""
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        """Return the count of the given label values."""
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        """Yield the (suffix, labels, value) samples of the text format."""
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield '', _format_labels(self.label_names, labels), value
+
+
+class MetricsRegistry:
+    """The metrics of the process, and the collectors which read the other statistics when scraped."""
+
+    def __init__(self):
+        """Initialize an empty registry."""
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _get_or_add(self, metric):
+        """Register a metric, or return the one already registered under its name."""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def histogram(self, name: str, help: str, label_names: tuple = (),
+                  buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        """Return the histogram of the given name, creating it if needed."""
+        return self._get_or_add(Histogram(name, help, label_names, buckets))
+
+    def counter(self, name: str, help: str, label_names: tuple = ()) -> Counter:
+        """Return the counter of the given name, creating it if needed."""
+        return self._get_or_add(Counter(name, help, label_names))
+
+    def add_collector(self, collect):
+        """Add a function called on every export, e.g. to read the hit counts of a cache.
+
+            Arguments:
+                collect {callable} -- called without arguments, it returns the
+                    (name, type, help, samples) of some metrics, the samples being
+                    a list of ({label name: value}, value).
+        """
+        with self._lock:
+            self._collectors.append(collect)
+
+    def render(self) -> str:
+        """Export all the metrics in the Prometheus text format."""
+        lines = []
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+            collectors = list(self._collectors)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{labels} {_format_value(value)}")
+        for collect in collectors:
+            try:
+                collected = list(collect())
+            except Exception as e:
+                print(f"There is error \"{str(e)}\" when collecting the metrics")
+                continue
+            for name, type, help, samples in collected:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {type}")
+                for labels, value in samples:
+                    names = tuple(labels)
+                    lines.append(f"{name}{_format_labels(names, tuple(labels[n] for n in names))} "
+                                 f"{_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+# the metrics of the whole process
+registry = MetricsRegistry()
+
+# the stages of the memes: decode, resize, font_load, layout, draw, encode, write and download
+stage_seconds = registry.histogram('meme_stage_seconds',
+                                   'The seconds spent in each stage of rendering a meme', ('stage',))
+# the parsing of the quote files by every strategy
+ingest_seconds = registry.histogram('quote_ingest_seconds',
+                                    'The seconds spent parsing a quote file', ('ingestor',))
+ingested_quotes = registry.counter('quote_ingested_total',
+                                   'The number of quotes parsed from the quote files', ('ingestor',))
+quote_cache_requests = registry.counter('quote_cache_requests_total',
+                                        'The lookups of the parsed quotes cache', ('result',))
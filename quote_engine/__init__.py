@@ -1,6 +1,23 @@
 from .quote_model import QuoteModel
+from .quote_store import QuoteStore
 from .ingestor_interface import IngestorInterface
-from .doc_ingestor import DOCXIngestor
-from .csv_ingestor import CSVIngestor
-from .pdf_ingestor import PDFIngestor
-from .txt_ingestor import TXTIngestor
\ No newline at end of file
+
+# the strategies are imported on first use, so that their parsing libraries
+# (python-docx, pandas, PyPDF2) are only loaded when a file of their type is parsed
+_LAZY_STRATEGIES = {
+    'DOCXIngestor': '.doc_ingestor',
+    'CSVIngestor': '.csv_ingestor',
+    'PDFIngestor': '.pdf_ingestor',
+    'TXTIngestor': '.txt_ingestor',
+    'JSONLIngestor': '.jsonl_ingestor',
+}
+
+
+def __getattr__(name):
+    """Import a strategy the first time it is accessed."""
+    if name in _LAZY_STRATEGIES:
+        from importlib import import_module
+        strategy = getattr(import_module(_LAZY_STRATEGIES[name], __name__), name)
+        globals()[name] = strategy
+        return strategy
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
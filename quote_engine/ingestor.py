@@ -1,39 +1,277 @@
 """Ingestor module to select an appropriate module for parsing the corresponding file"""
-from quote_engine import ( 
-                         QuoteModel
-                        ,IngestorInterface
-                        ,DOCXIngestor
-                        ,CSVIngestor
-                        ,PDFIngestor
-                        ,TXTIngestor
-)
+import os
+import gzip
+import time
+from importlib import import_module
+from importlib.metadata import entry_points
+from typing import Iterator
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from quote_engine import QuoteModel, IngestorInterface
+from quote_engine.quote_cache import QuoteCache
+from quote_engine.ingestor_interface import GZIP_MAGIC
+from metrics import ingest_seconds, ingested_quotes, quote_cache_requests
+
+# the entry point group through which other packages register their strategies,
+# each entry point being named after an extension, e.g. yaml = "my_plugin.yaml:YAMLIngestor"
+ENTRY_POINT_GROUP = 'quote_engine.ingestors'
+# the first bytes of the binary formats, to recognize the misnamed files
+MAGIC_NUMBERS = ((b'%PDF', '.pdf'), (b'PK\x03\x04', '.docx'), (GZIP_MAGIC, '.gz'))
+
+
+class FileReport:
+    """The outcome of parsing a single file."""
+
+    def __init__(self, path: str, quotes: list, seconds: float, error: str = None):
+        """Initialize the report of a file.
+
+            Arguments:
+                path {str} -- the parsed file.
+                quotes {list} -- the QuoteModel objects extracted from the file,
+                    up to the error if any.
+                seconds {float} -- the time taken to parse the file.
+                error {str} -- the error which stopped the parsing if any.
+        """
+        self.path = path
+        self.quotes = quotes
+        self.seconds = seconds
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        """Whether the file was parsed without error."""
+        return self.error is None
+
+    def __repr__(self):
+        """Summarize the report."""
+        outcome = f"quotes={len(self.quotes)}" + (f", error={self.error!r}" if self.error else '')
+        return f"FileReport({self.path!r}, {outcome}, seconds={self.seconds:.3f})"
+
+
+class IngestReport:
+    """The outcome of parsing many files, in the order the files were given."""
+
+    def __init__(self, files: list):
+        """Initialize the report from the report of every file."""
+        self.files = files
+
+    @property
+    def quotes(self) -> list:
+        """All the quotes, merged in the order of the files."""
+        return [quote for file in self.files for quote in file.quotes]
+
+    @property
+    def errors(self) -> list:
+        """The reports of the files which could not be parsed."""
+        return [file for file in self.files if not file.ok]
+
+
+def _parse_file(path: str) -> FileReport:
+    """Parse a single file and time it, for the pools of parse_many."""
+    started = time.perf_counter()
+    # the quotes parsed before an error are kept, and the error is reported with them
+    quotes, error = Ingestor.collect(path)
+    return FileReport(path, quotes, time.perf_counter() - started,
+                      f"{type(error).__name__}: {error}" if error is not None else None)
+
 
 class Ingestor(IngestorInterface):
     """The class to select an appropriate module for parsing the corresponding"""
-    
-    # the list of all ingestor helper classes
-    ingestors = [DOCXIngestor(), CSVIngestor(), PDFIngestor(), TXTIngestor()]
-    
+
+    # the ingestor helper class of every extension, either the class itself or
+    # "module:class" so that a strategy and its parsing library are only imported for its first file
+    registry = {
+        '.docx': 'quote_engine.doc_ingestor:DOCXIngestor',
+        '.csv': 'quote_engine.csv_ingestor:CSVIngestor',
+        '.csv.gz': 'quote_engine.csv_ingestor:CSVIngestor',
+        '.pdf': 'quote_engine.pdf_ingestor:PDFIngestor',
+        '.txt': 'quote_engine.txt_ingestor:TXTIngestor',
+        '.txt.gz': 'quote_engine.txt_ingestor:TXTIngestor',
+        '.jsonl': 'quote_engine.jsonl_ingestor:JSONLIngestor',
+        '.jsonl.gz': 'quote_engine.jsonl_ingestor:JSONLIngestor',
+    }
+    # the on-disk cache of the parsed quotes, set to None to always parse the files
+    cache = QuoteCache()
+    # whether the strategies of the installed packages were added to the registry
+    _entry_points_loaded = False
+
     # def __init__(self, path):
     #     """Initialize the list of ingestors"""
     #     self.ingestors = [DOCXIngestor(), CSVIngestor(), PDFIngestor(), TXTIngestor()]
-    
+
+    @classmethod
+    def register(cls, *extensions: str):
+        """Register a helper class for the given extensions, used as a class decorator.
+
+        Example:
+            @Ingestor.register('.yaml', '.yml')
+            class YAMLIngestor(IngestorInterface):
+                ...
+        """
+        def decorator(ingestor):
+            for extension in extensions:
+                cls.registry[cls._normalize(extension)] = ingestor
+            return ingestor
+        return decorator
+
+    @staticmethod
+    def _normalize(extension: str) -> str:
+        """Return the extension in lower case with its leading dot."""
+        extension = extension.lower()
+        return extension if extension.startswith('.') else '.' + extension
+
+    @staticmethod
+    def extension_of(path: str) -> str:
+        """Return the normalized extension of the given path, e.g. ".txt.gz" for a gzipped text file."""
+        root, extension = os.path.splitext(path.lower())
+        if extension == '.gz':
+            extension = os.path.splitext(root)[1] + extension
+        return extension
+
+    @classmethod
+    def _load_entry_points(cls):
+        """Add the strategies registered by the installed packages, once."""
+        if cls._entry_points_loaded:
+            return
+        cls._entry_points_loaded = True
+        for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+            # the strategies of the package itself come first
+            cls.registry.setdefault(cls._normalize(entry_point.name), entry_point.value)
+
+    @staticmethod
+    def sniff(path: str):
+        """Guess the extension of a misnamed file from its first bytes.
+
+            Returns:
+                the extension, or None if the content is not recognized.
+        """
+        try:
+            with open(path, 'rb') as file:
+                head = file.read(64)
+            extension = next((extension for magic, extension in MAGIC_NUMBERS
+                              if head.startswith(magic)), '')
+            if extension != '.gz':
+                # the text formats have no magic number, a JSON object starts a JSON Lines file
+                return extension or ('.jsonl' if head.lstrip().startswith(b'{') else None)
+            # only the first bytes are decompressed
+            with gzip.open(path, 'rb') as file:
+                head = file.read(64)
+        except (OSError, EOFError):
+            return None
+        return '.jsonl.gz' if head.lstrip().startswith(b'{') else '.txt.gz'
+
+    @classmethod
+    def ingestor_for(cls, path: str):
+        """Find the helper class to parse the given path by its extension, importing it if needed.
+
+        When the extension is not registered, the type of the file is sniffed from its content.
+
+            Returns:
+                the helper class, or None if the file type is not supported.
+        """
+        cls._load_entry_points()
+        extension = cls.extension_of(path)
+        if extension not in cls.registry:
+            extension = cls.sniff(path)
+            if extension not in cls.registry:
+                return None
+        ingestor = cls.registry[extension]
+        if isinstance(ingestor, str):
+            module_name, class_name = ingestor.split(':')
+            ingestor = getattr(import_module(module_name), class_name)
+            # the strategy is imported once
+            cls.registry[extension] = ingestor
+        return ingestor
+
     @classmethod
     def can_ingest(cls, path: str) -> bool:
-        """From all helper classes, find an appropriate class to parse the given path if any.
+        """Check if the extension of the given path has a helper class, without importing it.
+        """
+        cls._load_entry_points()
+        return cls.extension_of(path) in cls.registry
+
+    @classmethod
+    def collect(cls, path: str) -> tuple:
+        """Parse the file if supported and extract the quotes, stopping at the first error.
+
+        parse() of IngestorInterface prints or raises the error, and parse_many() reports it.
+
+            Returns:
+                the list of the quotes parsed before the error, and the error or None.
         """
-        return any(ingestor.can_ingest(path) for ingestor in cls.ingestors)
+        # reuse the quotes parsed before if the file did not change since
+        if cls.cache is not None:
+            cached_quotes = cls.cache.get(path)
+            quote_cache_requests.inc('miss' if cached_quotes is None else 'hit')
+            if cached_quotes is not None:
+                return cached_quotes, None
+
+        ingestor = cls.ingestor_for(path)
+        if ingestor is None:
+            return [], ValueError(f"No ingestor can parse the file {path}")
+
+        # time every strategy, including the ones of the other packages
+        with ingest_seconds.time(ingestor.__name__):
+            # the quotes parsed before an error are kept, the error tells a partial result
+            quotes, error = ingestor.collect(path)
+        ingested_quotes.inc(ingestor.__name__, amount=len(quotes))
+
+        # only the complete parses are cached, a failed one is parsed again next time
+        if cls.cache is not None and error is None and quotes:
+            cls.cache.put(path, quotes)
+
+        return quotes, error
 
     @classmethod
-    def parse(cls, path: str) -> list[QuoteModel]:
-        """Parse the file if supported and extract the quotes
+    def iter_parse(cls, path: str) -> Iterator[QuoteModel]:
+        """Yield the quotes of the file one at a time if supported, without keeping them all in memory
         """
-        # a list of parsed quotes from a file
-        quotes = []
+        # the quotes parsed before are already in memory
+        if cls.cache is not None:
+            cached_quotes = cls.cache.get(path)
+            quote_cache_requests.inc('miss' if cached_quotes is None else 'hit')
+            if cached_quotes is not None:
+                yield from cached_quotes
+                return
+
+        ingestor = cls.ingestor_for(path)
+        if ingestor is None:
+            raise ValueError(f"No ingestor can parse the file {path}")
+        yield from ingestor.iter_parse(path)
 
-        for ingestor in cls.ingestors:
-            if ingestor.can_ingest(path):
-                quotes = ingestor.parse(path)
-                break
+    @classmethod
+    def parse_many(cls, paths: list, max_workers: int = None,
+                   use_processes: bool = False) -> IngestReport:
+        """Parse many files in parallel, each with the appropriate ingestor.
 
-        return quotes
\ No newline at end of file
+            Arguments:
+                paths {list} -- the files to parse.
+                max_workers {int} -- the size of the pool, one per core by default.
+                use_processes {bool} -- parse in processes rather than threads, which
+                    is faster for the CPU-bound formats such as PDF and DOCX.
+
+            Returns:
+                the IngestReport holding the quotes, the timing and the error of every file
+                in the order of the given paths.
+        """
+        paths = list(paths)
+        if not paths:
+            return IngestReport([])
+        max_workers = min(max_workers or os.cpu_count() or 1, len(paths))
+        pool = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        with pool(max_workers=max_workers) as executor:
+            # map() keeps the order of the paths whatever the order the files finish in
+            return IngestReport(list(executor.map(_parse_file, paths)))
+
+    @classmethod
+    def parse_dir(cls, directory: str, max_workers: int = None,
+                  use_processes: bool = False) -> IngestReport:
+        """Parse all the supported files under the given directory, including subdirectories.
+
+            Returns:
+                the IngestReport of the files in sorted path order.
+        """
+        paths = []
+        for root, dirs, files in os.walk(directory):
+            paths.extend(os.path.join(root, name) for name in files
+                         if cls.can_ingest(name))
+        return cls.parse_many(sorted(paths), max_workers, use_processes)
@@ -1,7 +1,12 @@
 """Define the IngestorInterface abstract base class, which will be inherited by the ingestor classes."""
+import gzip
 from abc import ABC, abstractmethod
+from typing import Iterator
 from quote_engine import QuoteModel
 
+# the first bytes of a gzip file
+GZIP_MAGIC = b'\x1f\x8b'
+
 class IngestorInterface(ABC):
     """Define a common interface for all the classes that will be responsible for 
     parsing different types of files containing quotes.
@@ -19,10 +24,67 @@ class IngestorInterface(ABC):
         pass
     
     @classmethod
-    @abstractmethod
-    def parse(cls, path: str) -> list[QuoteModel]:
+    def parse(cls, path: str, strict: bool = False) -> list[QuoteModel]:
         """Parse the file and extract the quotes
         It takes a file path as input and returns a list of QuoteModel objects, 
-        which represent the extracted quotes.
+        which represent the extracted quotes, as read by iter_parse().
+        The errors are printed, or raised when strict is True.
+        """
+        quotes, error = cls.collect(path)
+        if error is not None:
+            if strict:
+                raise error
+            cls.report_error(path, error)
+        return quotes
+
+    @classmethod
+    def collect(cls, path: str) -> tuple:
+        """Read all the quotes of the file with iter_parse(), stopping at the first error.
+
+            Returns:
+                the list of the quotes parsed before the error, and the error or None.
+        """
+        # list of QuoteModel objects extracted from the given file
+        quotes = []
+        try:
+            # the quotes parsed before an error are kept
+            for quote in cls.iter_parse(path):
+                quotes.append(quote)
+        except Exception as e:
+            return quotes, e
+        return quotes, None
+
+    @staticmethod
+    def report_error(path: str, error: Exception):
+        """Print the error which stopped the parsing of the file."""
+        if isinstance(error, FileNotFoundError):
+            print(f"File not found: {path}")
+        else:
+            print(f"There is error \"{str(error)}\" when parsing the file {path}")
+
+    @classmethod
+    @abstractmethod
+    def iter_parse(cls, path: str) -> Iterator[QuoteModel]:
+        """Parse the file and yield the quotes one at a time
+        It is the streaming counterpart of parse(), which reads large files
+        with a constant memory use and raises the errors it encounters.
+        """
+        pass
+
+    @staticmethod
+    def open_text(path: str, newline: str = None):
+        """Open a text file for reading, decompressing it on the fly if it is gzipped.
+
+        The file is recognized by its first bytes rather than its name, and it is
+        decompressed as it is read, so a large file is never decompressed at once.
+
+            Returns:
+                the text file object.
         """
-        pass
\ No newline at end of file
+        with open(path, 'rb') as file:
+            compressed = file.read(2) == GZIP_MAGIC
+        # utf-8-sig drops the byte order mark some editors write, which would
+        # otherwise end up in the first CSV column name or the first quote
+        if compressed:
+            return gzip.open(path, 'rt', encoding='utf-8-sig', newline=newline)
+        return open(path, 'r', encoding='utf-8-sig', newline=newline)
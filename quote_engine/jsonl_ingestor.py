@@ -0,0 +1,38 @@
+"""Strategy object for the JSON Lines file type."""
+import json
+from typing import Iterator
+from quote_engine import (
+                         QuoteModel
+                        ,IngestorInterface
+)
+
+class JSONLIngestor(IngestorInterface):
+    """This class is responsible for parsing JSON Lines files"""
+
+    # every line is an object such as {"body": "To bork or not to bork", "author": "Bork"}
+
+    @classmethod
+    def can_ingest(cls, path: str) -> bool:
+        """Check if the given path is a JSON Lines file.
+
+        Returns:
+            True if the path is a JSON Lines file, gzipped or not
+        """
+        return path.lower().endswith(('.jsonl', '.jsonl.gz'))
+
+    @classmethod
+    def iter_parse(cls, path: str) -> Iterator[QuoteModel]:
+        """Extract the quotes from the file given one at a time, reading it line by line.
+
+        Yields:
+            quote: QuoteModel objects
+        """
+        # a gzipped file is decompressed as it is read
+        with cls.open_text(path) as file:
+            for line in file:
+                # skip the blank lines, e.g. at the end of the file
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                # create a corresponding QuoteModel object
+                yield QuoteModel(record['body'], record['author'])
@@ -1,9 +1,9 @@
 """Strategy object for the pdf file type."""
+from typing import Iterator
 from quote_engine import ( 
                          QuoteModel
                         ,IngestorInterface
 )
-import PyPDF2
 
 class PDFIngestor(IngestorInterface):
     """This class is responsible for parsing pdf files"""
@@ -22,39 +22,30 @@ class PDFIngestor(IngestorInterface):
         return path.endswith('.pdf')
 
     @classmethod
-    def parse(cls, path: str) -> list[QuoteModel]:
-        """Extract the quote body and author from the file given.
+    def iter_parse(cls, path: str) -> Iterator[QuoteModel]:
+        """Extract the quotes from the file given one at a time, reading it page by page.
         
-        Returns:
-            quotes: list of QuoteModel objects
+        Yields:
+            quote: QuoteModel objects
         """
-        # list of QuoteModel objects extracted from the given pdf file
-        quotes = []
-
-        try:
-            with open(path, 'rb') as file:
-                # read the pdf file
-                pdf_file = PyPDF2.PdfReader(file)
-                # parse each pdf file page
-                for page in pdf_file.pages:
-                    # get the content of the page
-                    text = page.extract_text()
-                    # parse each line of the pdf page
-                    for line in text.split('\n'):
-                        """extract body and author
-                        strip(): remove any leading or trailing whitespace characters
-                        split(' - '): split the line into a list of values based on the comma (,) delimiter
-                        """
-                        line_values = line.strip().split(' - ')
-                        if len(line_values) == 2:
-                            body, author = line.strip().split(' - ')
-                            # create a corresponding QuoteModel object
-                            quote = QuoteModel(body, author)
-                            # store in the quotes list
-                            quotes.append(quote)
-        except FileNotFoundError:
-            print(f"File not found: {path}")
-        except Exception as e:
-            print(f"There is error \"{str(e)}\" when parsing the file {path}")
+        # imported here so that PyPDF2 is only loaded when a pdf file is parsed
+        import PyPDF2
 
-        return quotes
\ No newline at end of file
+        with open(path, 'rb') as file:
+            # read the pdf file
+            pdf_file = PyPDF2.PdfReader(file)
+            # parse each pdf file page, the text of a single page is extracted at a time
+            for page in pdf_file.pages:
+                # get the content of the page
+                text = page.extract_text()
+                # parse each line of the pdf page
+                for line in text.split('\n'):
+                    """extract body and author
+                    strip(): remove any leading or trailing whitespace characters
+                    split(' - '): split the line into a list of values based on the comma (,) delimiter
+                    """
+                    line_values = line.strip().split(' - ')
+                    if len(line_values) == 2:
+                        body, author = line_values
+                        # create a corresponding QuoteModel object
+                        yield QuoteModel(body, author)
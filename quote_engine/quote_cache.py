@@ -0,0 +1,67 @@
+"""On-disk cache of the parsed quotes, so the quote files are not parsed on every start."""
+import os
+import pickle
+import hashlib
+import tempfile
+from quote_engine import QuoteModel
+
+
+class QuoteCache:
+    """Keep the quotes parsed from each file in a pickle file of a cache directory.
+
+    An entry is keyed by the path, the size and the mtime of the quote file,
+    so it is ignored as soon as the quote file changes.
+    """
+
+    # bump when the format of the cached files changes
+    version = 1
+
+    def __init__(self, cache_dir: str = './.quote_cache'):
+        """Initialize the cache.
+
+            Arguments:
+                cache_dir {str} -- the directory to store the parsed quotes into.
+        """
+        self.cache_dir = cache_dir
+
+    def _entry_path(self, path: str) -> str:
+        """Return the location of the cached quotes of the given quote file."""
+        name = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, name + '.pkl')
+
+    @staticmethod
+    def _signature(path: str) -> tuple:
+        """Return what identifies the current content of the given quote file."""
+        stat = os.stat(path)
+        return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+    def get(self, path: str):
+        """Load the cached quotes of the given quote file.
+
+            Returns:
+                the list of QuoteModel objects, or None if the file changed or is not cached.
+        """
+        try:
+            signature = self._signature(path)
+            with open(self._entry_path(path), 'rb') as file:
+                version, cached_signature, rows = pickle.load(file)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            return None
+        if version != self.version or cached_signature != signature:
+            return None
+        return [QuoteModel(body, author) for body, author in rows]
+
+    def put(self, path: str, quotes: list):
+        """Store the quotes parsed from the given quote file."""
+        try:
+            signature = self._signature(path)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # store plain (body, author) tuples, which are smaller and faster than objects
+            rows = [(quote.quote_body, quote.author) for quote in quotes]
+            # write then rename so a concurrent reader never loads a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as file:
+                pickle.dump((self.version, signature, rows), file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._entry_path(path))
+        except OSError as e:
+            print(f"There is error \"{str(e)}\" when caching the quotes of {path}")
@@ -1,17 +1,49 @@
 """Quote model class"""
 
 class QuoteModel:
-    """A class encapsulating a quote with a body and an author."""
+    """A class encapsulating a quote with a body and an author.
+
+    The quotes are immutable and hashable, and __slots__ avoids a per-instance __dict__.
+    """
+
+    __slots__ = ('quote_body', 'author')
 
     def __init__(self, quote_body, author):
-        """Takes in the body and author as parameters and 
+        """Takes in the body and author as parameters and
         initializes the corresponding instance variables.
         """
-        self.quote_body = quote_body
-        self.author = author
+        # the attributes can only be set once, here
+        object.__setattr__(self, 'quote_body', quote_body)
+        object.__setattr__(self, 'author', author)
+
+    def __setattr__(self, name, value):
+        """Prevent changing a quote, which would change its hash."""
+        raise AttributeError(f"QuoteModel is immutable, cannot set {name}")
+
+    def __delattr__(self, name):
+        """Prevent deleting an attribute of a quote."""
+        raise AttributeError(f"QuoteModel is immutable, cannot delete {name}")
+
+    def __reduce__(self):
+        """Pickle the quote through its constructor, e.g. for a process pool."""
+        return (QuoteModel, (self.quote_body, self.author))
+
+    def __eq__(self, other):
+        """Two quotes are equal when they have the same body and author."""
+        if not isinstance(other, QuoteModel):
+            return NotImplemented
+        return self.quote_body == other.quote_body and self.author == other.author
+
+    def __hash__(self):
+        """Hash the body and the author."""
+        return hash((self.quote_body, self.author))
+
+    def __repr__(self):
+        """Returns the code to create the quote."""
+        return f'QuoteModel({self.quote_body!r}, {self.author!r})'
+
     def __str__(self):
-        """Returns a formatted string that combines the quote body and author 
+        """Returns a formatted string that combines the quote body and author
         in the format: "quote body" - author.
         """
         return f'"{self.quote_body}" - {self.author}'
-        
\ No newline at end of file
@@ -0,0 +1,309 @@
+"""A compact and indexed in-memory corpus of quotes."""
+import re
+import random
+import hashlib
+import threading
+from bisect import bisect_left
+import unicodedata
+from array import array
+from collections.abc import Sequence
+from quote_engine import QuoteModel
+
+# the words of a quote which are indexed as keywords
+_WORD_PATTERN = re.compile(r"[\w']+")
+# the number of intersections of several filters kept by a store
+_MAX_INTERSECTIONS = 256
+
+
+def normalize(text) -> str:
+    """Normalize a body or an author so that the variants of the same quote compare equal.
+
+    The case, the surrounding quotes, the byte order mark and repeated whitespaces are ignored.
+    """
+    text = unicodedata.normalize('NFKC', str(text)).replace('﻿', '')
+    text = ' '.join(text.split()).strip('"\'“”‘’ ')
+    return text.casefold()
+
+
+def keywords(text) -> set:
+    """Split a text into its distinct normalized keywords."""
+    return {word.strip("'") for word in _WORD_PATTERN.findall(normalize(text))} - {''}
+
+
+class QuoteStore(Sequence):
+    """Keep many quotes in a few contiguous buffers instead of one object per quote.
+
+    The bodies are encoded into a single UTF-8 blob addressed by an array of offsets,
+    and every distinct author is stored once and referenced by an array of ids.
+    The store is a sequence which hands out QuoteModel views on demand,
+    so random.choice(), len() and iteration work as with a list of quotes.
+
+    The quotes are deduplicated on their normalized (body, author), and indexed by
+    author and by keyword so that sample() never scans the whole corpus.
+    The duplicates are found through an open-addressed table of 64-bit hashes,
+    which takes about 16 bytes per quote instead of a dict of digests.
+    """
+
+    def __init__(self, quotes=()):
+        """Initialize the store with the given quotes if any.
+
+            Arguments:
+                quotes {iterable} -- the QuoteModel objects to add.
+        """
+        # the UTF-8 bodies of all the quotes, one after the other
+        self._bodies = bytearray()
+        # the quote i has its body at self._bodies[offsets[i]:offsets[i + 1]]
+        self._body_offsets = array('Q', [0])
+        # the interned authors, each of them is stored once
+        self._authors = []
+        self._author_ids = {}
+        # the id of the author of every quote
+        self._quote_authors = array('I')
+        # the sampling weight of every quote
+        self._weights = array('d')
+        # the 64-bit hash of the normalized (body, author) of every quote
+        self._hashes = array('Q')
+        # the open-addressed table of the hashes, a slot holds the index of a quote + 1 or 0 when empty
+        self._slots = array('I', [0]) * 8
+        # the normalized author -> the indexes of its quotes
+        self._author_index = {}
+        # the keyword -> the indexes of the quotes containing it
+        self._keyword_index = {}
+        # the alias tables of the weighted sampling, per filter
+        self._alias_tables = {}
+        # the indexes of the quotes matching several filters at once, per filter,
+        # guarded by a lock since the requests sample concurrently
+        self._intersections = {}
+        self._intersections_lock = threading.Lock()
+        self.extend(quotes)
+
+    def append(self, quote: QuoteModel, weight: float = 1.0) -> int:
+        """Add a quote at the end of the store.
+
+        A duplicate of a quote already in the store is not added again,
+        its weight is added to the weight of the existing quote instead.
+
+            Returns:
+                the index of the quote in the store.
+        """
+        normalized_body = normalize(quote.quote_body)
+        normalized_author = normalize(quote.author)
+        key = f"{normalized_body}\0{normalized_author}".encode('utf-8')
+        quote_hash = int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+        # the weights are about to change
+        self._alias_tables.clear()
+
+        slot = self._find_slot(quote_hash, normalized_body, normalized_author)
+        if self._slots[slot]:
+            index = self._slots[slot] - 1
+            self._weights[index] += weight
+            return index
+        # the quotes matching several filters are about to change
+        with self._intersections_lock:
+            self._intersections.clear()
+
+        author = str(quote.author)
+        author_id = self._author_ids.get(author)
+        if author_id is None:
+            author_id = len(self._authors)
+            self._authors.append(author)
+            self._author_ids[author] = author_id
+
+        index = len(self._quote_authors)
+        self._bodies += str(quote.quote_body).encode('utf-8')
+        self._body_offsets.append(len(self._bodies))
+        self._quote_authors.append(author_id)
+        self._weights.append(weight)
+        self._hashes.append(quote_hash)
+        self._slots[slot] = index + 1
+        # keep the table at most half full, so that the probe sequences stay short
+        if 2 * len(self._hashes) > len(self._slots):
+            self._grow()
+
+        self._author_index.setdefault(normalized_author, array('I')).append(index)
+        for keyword in keywords(quote.quote_body):
+            self._keyword_index.setdefault(keyword, array('I')).append(index)
+        return index
+
+    def _find_slot(self, quote_hash: int, normalized_body: str, normalized_author: str) -> int:
+        """Find the slot of the table holding the given quote, or the empty slot to put it in."""
+        mask = len(self._slots) - 1
+        slot = quote_hash & mask
+        while self._slots[slot]:
+            index = self._slots[slot] - 1
+            # the hashes are only 64-bit, so an equal hash is checked against the quote itself
+            if (self._hashes[index] == quote_hash
+                    and normalize(self.body(index)) == normalized_body
+                    and normalize(self.author(index)) == normalized_author):
+                return slot
+            # linear probing
+            slot = (slot + 1) & mask
+        return slot
+
+    def _grow(self):
+        """Double the size of the table of the hashes and insert them again."""
+        self._slots = array('I', [0]) * (2 * len(self._slots))
+        mask = len(self._slots) - 1
+        for index, quote_hash in enumerate(self._hashes):
+            slot = quote_hash & mask
+            while self._slots[slot]:
+                slot = (slot + 1) & mask
+            self._slots[slot] = index + 1
+
+    def extend(self, quotes):
+        """Add all the given quotes, e.g. a list or the iter_parse() stream of an ingestor."""
+        for quote in quotes:
+            self.append(quote)
+
+    @property
+    def authors(self) -> list:
+        """The distinct authors of the quotes, in the order they were added."""
+        return list(self._authors)
+
+    def body(self, index: int) -> str:
+        """Decode the body of the quote at the given index."""
+        start = self._body_offsets[index]
+        end = self._body_offsets[index + 1]
+        return self._bodies[start:end].decode('utf-8')
+
+    def author(self, index: int) -> str:
+        """Return the author of the quote at the given index."""
+        return self._authors[self._quote_authors[index]]
+
+    def weight(self, index: int) -> float:
+        """Return the sampling weight of the quote at the given index."""
+        return self._weights[index]
+
+    def by_author(self, author: str) -> list:
+        """Return the quotes of the given author, whatever the case."""
+        return [self[index] for index in self._author_index.get(normalize(author), ())]
+
+    def search(self, query: str) -> list:
+        """Return the quotes containing all the keywords of the query."""
+        return [self[index] for index in self._candidates(None, query)]
+
+    def sample(self, author: str = None, query: str = None, weighted: bool = False,
+               rng=random):
+        """Pick a random quote, optionally among the quotes of an author or matching a query.
+
+        A uniform pick is O(1), and so is a weighted pick once the alias table of
+        the filter is built. A pick among the quotes of an author and some keywords,
+        or of several keywords, first intersects their indexes, which takes a binary
+        search in the longer indexes per quote of the shortest one; the intersection
+        is then kept until a quote is added, so the next picks of the filter are O(1).
+
+            Arguments:
+                author {str} -- only pick a quote of this author, whatever the case.
+                query {str} -- only pick a quote containing all the keywords of the query.
+                weighted {bool} -- pick the quotes proportionally to their weights.
+                rng {random.Random} -- the source of randomness.
+
+            Returns:
+                a QuoteModel, or None when no quote matches.
+        """
+        candidates = self._candidates(author, query)
+        if len(candidates) == 0:
+            return None
+        if not weighted:
+            return self[candidates[rng.randrange(len(candidates))]]
+
+        filter_key = (normalize(author) if author else None,
+                      tuple(sorted(keywords(query))) if query else None)
+        table = self._alias_tables.get(filter_key)
+        if table is None:
+            table = self._build_alias_table([self._weights[index] for index in candidates])
+            self._alias_tables[filter_key] = table
+        probabilities, aliases = table
+        if probabilities is None:
+            return None
+        slot = rng.randrange(len(candidates))
+        if rng.random() >= probabilities[slot]:
+            slot = aliases[slot]
+        return self[candidates[slot]]
+
+    def _candidates(self, author: str, query: str):
+        """Return the indexes of the quotes matching the filters, using the indexes only."""
+        postings = []
+        if author:
+            postings.append(self._author_index.get(normalize(author), ()))
+        if query:
+            words = keywords(query)
+            if not words:
+                return ()
+            postings.extend(self._keyword_index.get(word, ()) for word in words)
+        if not postings:
+            return range(len(self))
+        if len(postings) == 1:
+            return postings[0]
+
+        filter_key = (normalize(author) if author else None, tuple(sorted(words)) if query else None)
+        with self._intersections_lock:
+            intersection = self._intersections.get(filter_key)
+        if intersection is None:
+            # intersect from the shortest posting list, the indexes are added in increasing
+            # order so they are binary searched in the other posting lists
+            postings.sort(key=len)
+            intersection = array('I', (index for index in postings[0]
+                                       if all(self._contains(posting, index) for posting in postings[1:])))
+            with self._intersections_lock:
+                if len(self._intersections) >= _MAX_INTERSECTIONS:
+                    # forget the oldest intersection
+                    del self._intersections[next(iter(self._intersections))]
+                self._intersections[filter_key] = intersection
+        return intersection
+
+    @staticmethod
+    def _contains(posting, index: int) -> bool:
+        """Check whether the sorted posting list holds the given index."""
+        position = bisect_left(posting, index)
+        return position < len(posting) and posting[position] == index
+
+    @staticmethod
+    def _build_alias_table(weights: list) -> tuple:
+        """Build the tables of Vose's alias method for O(1) weighted sampling.
+
+            Returns:
+                the (probabilities, aliases) lists, or (None, None) if all the weights are zero.
+        """
+        total = sum(weights)
+        if total <= 0:
+            return None, None
+        count = len(weights)
+        probabilities = [weight * count / total for weight in weights]
+        aliases = list(range(count))
+        small = [i for i, p in enumerate(probabilities) if p < 1]
+        large = [i for i, p in enumerate(probabilities) if p >= 1]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            # the slot of less is completed by more
+            aliases[less] = more
+            probabilities[more] += probabilities[less] - 1
+            (small if probabilities[more] < 1 else large).append(more)
+        # the rest are only off by rounding errors
+        for i in small + large:
+            probabilities[i] = 1.0
+        return probabilities, aliases
+
+    def __getitem__(self, index):
+        """Return a QuoteModel view of the quote at the given index, or a list for a slice."""
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('quote index out of range')
+        return QuoteModel(self.body(index), self.author(index))
+
+    def __len__(self):
+        """Return the number of quotes."""
+        return len(self._quote_authors)
+
+    def nbytes(self) -> int:
+        """Estimate the memory taken by the buffers of the store."""
+        return (len(self._bodies)
+                + self._body_offsets.itemsize * len(self._body_offsets)
+                + self._quote_authors.itemsize * len(self._quote_authors)
+                + self._weights.itemsize * len(self._weights)
+                + self._hashes.itemsize * len(self._hashes)
+                + self._slots.itemsize * len(self._slots)
+                + sum(len(author) for author in self._authors))
@@ -1,4 +1,5 @@
 """Strategy object for the txt file type."""
+from typing import Iterator
 from quote_engine import ( 
                          QuoteModel
                         ,IngestorInterface
@@ -15,37 +16,26 @@ class TXTIngestor(IngestorInterface):
         """Check if the given path is a txt file.
         
         Returns:
-            True if the path is a txt file
+            True if the path is a txt file, gzipped or not
         """
         # return file_extension in cls.allowed_extensions
-        return path.endswith('.txt')
+        return path.lower().endswith(('.txt', '.txt.gz'))
 
     @classmethod
-    def parse(cls, path: str) -> list[QuoteModel]:
-        """Extract the quote body and author from the file given.
+    def iter_parse(cls, path: str) -> Iterator[QuoteModel]:
+        """Extract the quotes from the file given one at a time, reading it line by line.
         
-        Returns:
-            quotes: list of QuoteModel objects
+        Yields:
+            quote: QuoteModel objects
         """
-        # list of QuoteModel objects extracted from the given txt file
-        quotes = []
-
-        try:
-            with open(path, 'r') as file:
-                # parse line by line
-                for line in file:
-                    """extract body and author
-                    strip(): remove any leading or trailing whitespace characters
-                    split(' - '): split the line into a list of values based on the comma (,) delimiter
-                    """
-                    body, author = line.strip().split(' - ')
-                    # create a corresponding QuoteModel object
-                    quote = QuoteModel(body, author)
-                    # store in the quotes list
-                    quotes.append(quote)
-        except FileNotFoundError:
-            print(f"File not found: {path}")
-        except Exception as e:
-            print(f"There is error \"{str(e)}\" when parsing the file {path}")
-
-        return quotes
\ No newline at end of file
+        # a gzipped file is decompressed as it is read
+        with cls.open_text(path) as file:
+            # parse line by line
+            for line in file:
+                """extract body and author
+                strip(): remove any leading or trailing whitespace characters
+                split(' - '): split the line into a list of values based on the comma (,) delimiter
+                """
+                body, author = line.strip().split(' - ')
+                # create a corresponding QuoteModel object
+                yield QuoteModel(body, author)
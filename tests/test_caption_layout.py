@@ -0,0 +1,41 @@
+"""Test the word wrapping and the font fitting of the captions."""
+import time
+import unittest
+from meme_engine.caption_layout import layout_caption, wrap_words, MARGIN
+from meme_engine.font_registry import FontRegistry, DEFAULT_FONT_PATH
+
+
+class TestCaptionLayout(unittest.TestCase):
+    """The captions are wrapped within the image, quickly whatever their length."""
+
+    def test_long_unbroken_word(self):
+        font = FontRegistry.get_font(DEFAULT_FONT_PATH, 20)
+        word = 'x' * 5000
+        started = time.perf_counter()
+        lines = wrap_words(word, font, 200)
+        # the cuts are binary searched, the former character by character search took minutes
+        self.assertLess(time.perf_counter() - started, 2)
+        self.assertEqual(''.join(lines), word)
+        widths = [FontRegistry.text_size(font, line)[0] for line in lines]
+        self.assertTrue(all(width <= 200 for width in widths))
+        # every line but the last one is as long as it can be
+        self.assertTrue(all(FontRegistry.text_size(font, line + 'x')[0] > 200 for line in lines[:-1]))
+
+    def test_caption_which_does_not_fit(self):
+        started = time.perf_counter()
+        layout = layout_caption('x' * 4000, 'Rex', 500, 300, DEFAULT_FONT_PATH, 36, 10)
+        self.assertLess(time.perf_counter() - started, 5)
+        # the smallest font is used, and the lines still fit in the width of the image
+        self.assertEqual(layout.font_size, 10)
+        self.assertLessEqual(layout.width, 500 - 2 * MARGIN)
+        self.assertGreater(layout.height, 300)
+
+    def test_caption_which_fits(self):
+        layout = layout_caption('To bork or not to bork', 'Bork', 500, 400, DEFAULT_FONT_PATH, 36, 10)
+        self.assertEqual(layout.lines[-1], '- Bork')
+        self.assertLessEqual(layout.width, 500 - 2 * MARGIN)
+        self.assertLessEqual(layout.height, 400 * 0.4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+"""Test the ImageCatalog against a temporary directory of images."""
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from PIL import Image
+from meme_engine.image_catalog import ImageCatalog
+
+
+class TestImageCatalog(unittest.TestCase):
+    """The catalog survives symlink loops and malformed indexes."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='catalog-test-')
+        self.root = os.path.join(self.directory, 'images')
+        os.makedirs(os.path.join(self.root, 'sub'))
+        Image.new('RGB', (30, 20), 'red').save(os.path.join(self.root, 'a.jpg'))
+        Image.new('RGB', (40, 20), 'blue').save(os.path.join(self.root, 'sub', 'b.png'))
+        self.index_path = os.path.join(self.directory, 'index.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_symlink_loop_is_not_followed(self):
+        os.symlink(self.root, os.path.join(self.root, 'sub', 'loop'))
+        catalog = ImageCatalog(self.root)
+        catalog.scan()
+        self.assertEqual([os.path.relpath(path, self.root) for path in catalog.paths],
+                         ['a.jpg', os.path.join('sub', 'b.png')])
+
+    def test_malformed_index_is_rebuilt(self):
+        for images in ([['a.jpg', 1, 2]], [[1, 2, 3, 'w', 5, 'JPEG', 'RGB'], [2, 2, 3, 4, 5, 'JPEG', 'RGB']], 'x'):
+            with open(self.index_path, 'w') as file:
+                json.dump({'version': ImageCatalog.version, 'root': self.root, 'images': images}, file)
+            with redirect_stdout(StringIO()):
+                catalog = ImageCatalog(self.root, self.index_path)
+            self.assertEqual(len(catalog), 0)
+            self.assertTrue(catalog.scan())
+            self.assertEqual(len(catalog), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
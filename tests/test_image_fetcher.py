@@ -0,0 +1,141 @@
+"""Test the ImageFetcher against a local stand-in HTTP server."""
+import time
+import threading
+import unittest
+from io import BytesIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PIL import Image
+from meme_engine.image_fetcher import ImageFetcher, FetchError, ImageTooLargeError, is_public_address
+
+
+def make_jpeg() -> bytes:
+    """Return the bytes of a small JPEG image."""
+    buffer = BytesIO()
+    Image.new('RGB', (20, 10), 'red').save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serve an image, redirects, a large body, a body trickled a byte at a time, and a revalidated image."""
+
+    image = make_jpeg()
+
+    def do_GET(self):
+        if self.path == '/image.jpg':
+            self._send(self.image)
+        elif self.path == '/etag.jpg':
+            if self.headers.get('If-None-Match') == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+            else:
+                self._send(self.image, {'ETag': '"v1"'})
+        elif self.path == '/redirect.jpg':
+            self.send_response(302)
+            self.send_header('Location', '/image.jpg')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.path == '/loop.jpg':
+            self.send_response(302)
+            self.send_header('Location', '/loop.jpg')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.path == '/large.jpg':
+            # no Content-Length, so the size is only known by reading
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(b'\0' * 4096)
+        elif self.path == '/trickle.jpg':
+            self.send_response(200)
+            self.send_header('Content-Length', '100')
+            self.end_headers()
+            try:
+                for _ in range(100):
+                    self.wfile.write(b'\xff')
+                    self.wfile.flush()
+                    time.sleep(0.25)
+            except OSError:
+                # the client gave up
+                pass
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+    def _send(self, body: bytes, headers: dict = None):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        # keep the test output quiet
+        pass
+
+
+class TestImageFetcher(unittest.TestCase):
+    """The timeouts, the size limit and the revalidation of the downloads."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        cls.server.daemon_threads = True
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_fetch_image(self):
+        buffer = ImageFetcher(allow_private=True).fetch_image(self.base_url + '/image.jpg')
+        self.assertEqual(buffer.getvalue(), StandInHandler.image)
+
+    def test_redirects(self):
+        fetcher = ImageFetcher(allow_private=True)
+        self.assertEqual(fetcher.fetch(self.base_url + '/redirect.jpg'), StandInHandler.image)
+        with self.assertRaises(FetchError):
+            fetcher.fetch(self.base_url + '/loop.jpg')
+
+    def test_private_addresses_are_refused(self):
+        # the stand-in server itself is on the loopback
+        for url in (self.base_url + '/image.jpg', 'http://169.254.169.254/latest/meta-data/',
+                    'http://10.0.0.1/image.jpg', 'http://[::ffff:127.0.0.1]/image.jpg',
+                    'file:///etc/passwd'):
+            with self.assertRaises(FetchError):
+                ImageFetcher().fetch(url)
+
+    def test_public_addresses(self):
+        self.assertTrue(is_public_address('93.184.216.34'))
+        self.assertTrue(is_public_address('2606:4700::1111'))
+        for address in ('127.0.0.1', '10.1.2.3', '192.168.0.1', '172.16.0.1', '169.254.169.254',
+                        '::1', 'fe80::1', 'fc00::1', '::ffff:10.0.0.1', '0.0.0.0', '224.0.0.1'):
+            self.assertFalse(is_public_address(address), address)
+
+    def test_missing_image(self):
+        with self.assertRaises(FetchError):
+            ImageFetcher(allow_private=True).fetch(self.base_url + '/missing.jpg')
+
+    def test_too_large(self):
+        with self.assertRaises(ImageTooLargeError):
+            ImageFetcher(max_bytes=1024, allow_private=True).fetch(self.base_url + '/large.jpg')
+
+    def test_revalidation(self):
+        fetcher = ImageFetcher(allow_private=True)
+        first = fetcher.fetch(self.base_url + '/etag.jpg')
+        # the server answers 304 and the cached content is returned
+        self.assertEqual(fetcher.fetch(self.base_url + '/etag.jpg'), first)
+
+    def test_deadline_of_a_trickling_host(self):
+        fetcher = ImageFetcher(read_timeout=1, deadline=2, allow_private=True)
+        started = time.monotonic()
+        with self.assertRaises(FetchError):
+            fetcher.fetch(self.base_url + '/trickle.jpg')
+        # the server would trickle for 25 seconds
+        self.assertLess(time.monotonic() - started, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
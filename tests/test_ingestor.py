@@ -0,0 +1,220 @@
+"""Test the Ingestor and its cache of the parsed quotes."""
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from quote_engine import QuoteModel, IngestorInterface
+from quote_engine.ingestor import Ingestor
+from quote_engine.quote_cache import QuoteCache
+
+# the sample files of the repository, with five quotes each
+SIMPLE_LINES = os.path.join(os.path.dirname(__file__), os.pardir, '_data', 'SimpleLines')
+
+
+class TestIngestorCache(unittest.TestCase):
+    """A parse which fails partway keeps its quotes, but is never cached."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='ingestor-test-')
+        self.cache = Ingestor.cache
+        Ingestor.cache = QuoteCache(os.path.join(self.directory, 'cache'))
+        self.path = os.path.join(self.directory, 'quotes.txt')
+        with open(self.path, 'w', encoding='utf-8') as file:
+            file.write("Bark - Rex\nNo author on this line\nBork - Fido\n")
+
+    def tearDown(self):
+        Ingestor.cache = self.cache
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_partial_parse_is_not_cached(self):
+        with redirect_stdout(StringIO()) as output:
+            quotes = Ingestor.parse(self.path)
+        self.assertEqual([quote.author for quote in quotes], ['Rex'])
+        self.assertIn('There is error', output.getvalue())
+        self.assertIsNone(Ingestor.cache.get(self.path))
+
+        # the file is still reported as failed after the lenient parse, with its partial quotes
+        report = Ingestor.parse_many([self.path])
+        self.assertIsNotNone(report.files[0].error)
+        self.assertEqual([quote.author for quote in report.quotes], ['Rex'])
+
+    def test_complete_parse_is_cached(self):
+        with open(self.path, 'w', encoding='utf-8') as file:
+            file.write("Bark - Rex\nBork - Fido\n")
+        Ingestor.parse(self.path)
+        self.assertEqual([quote.author for quote in Ingestor.cache.get(self.path)], ['Rex', 'Fido'])
+
+    def test_strict_parse_raises(self):
+        with self.assertRaises(ValueError):
+            Ingestor.parse(self.path, strict=True)
+
+
+class TestByteOrderMark(unittest.TestCase):
+    """The byte order mark some editors write is not part of the quotes."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='ingestor-test-')
+        # parse the files rather than read them from the cache
+        self.cache = Ingestor.cache
+        Ingestor.cache = None
+
+    def tearDown(self):
+        Ingestor.cache = self.cache
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_csv_with_bom(self):
+        path = os.path.join(self.directory, 'quotes.csv')
+        with open(path, 'w', encoding='utf-8-sig') as file:
+            file.write("body,author\nBark,Rex\n")
+        self.assertEqual([(quote.quote_body, quote.author) for quote in Ingestor.iter_parse(path)],
+                         [('Bark', 'Rex')])
+
+    def test_gzipped_txt_with_bom(self):
+        path = os.path.join(self.directory, 'quotes.txt.gz')
+        with gzip.open(path, 'wt', encoding='utf-8-sig') as file:
+            file.write("Bark - Rex\n")
+        self.assertEqual([(quote.quote_body, quote.author) for quote in Ingestor.iter_parse(path)],
+                         [('Bark', 'Rex')])
+
+
+class TestRegistry(unittest.TestCase):
+    """The strategies are found by the extension of a file, or by its first bytes when it is misnamed."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='ingestor-test-')
+        self.cache = Ingestor.cache
+        Ingestor.cache = None
+        self.registry = dict(Ingestor.registry)
+
+    def tearDown(self):
+        Ingestor.registry.clear()
+        Ingestor.registry.update(self.registry)
+        Ingestor.cache = self.cache
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def copy(self, name: str, target: str) -> str:
+        """Copy a sample file under another name."""
+        path = os.path.join(self.directory, target)
+        shutil.copyfile(os.path.join(SIMPLE_LINES, name), path)
+        return path
+
+    def gzip(self, content: str, target: str) -> str:
+        """Write a gzipped text file."""
+        path = os.path.join(self.directory, target)
+        with gzip.open(path, 'wt', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def test_register(self):
+        @Ingestor.register('shout', '.YELL')
+        class ShoutIngestor(IngestorInterface):
+            @classmethod
+            def can_ingest(cls, path: str) -> bool:
+                return True
+
+            @classmethod
+            def iter_parse(cls, path: str):
+                with open(path, encoding='utf-8') as file:
+                    for line in file:
+                        yield QuoteModel(line.strip().upper(), 'Rex')
+
+        # the extensions are normalized, and the decorator returns the class itself
+        self.assertIs(Ingestor.registry['.shout'], ShoutIngestor)
+        self.assertIs(Ingestor.registry['.yell'], ShoutIngestor)
+        path = os.path.join(self.directory, 'quotes.Yell')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write("bark\n")
+        self.assertTrue(Ingestor.can_ingest(path))
+        self.assertEqual([quote.quote_body for quote in Ingestor.parse(path)], ['BARK'])
+
+    def test_extension_of(self):
+        self.assertEqual(Ingestor.extension_of('quotes.TXT'), '.txt')
+        self.assertEqual(Ingestor.extension_of('dir.v2/quotes.txt.gz'), '.txt.gz')
+        self.assertEqual(Ingestor.extension_of('quotes.jsonl.GZ'), '.jsonl.gz')
+        self.assertEqual(Ingestor.extension_of('quotes.gz'), '.gz')
+        self.assertEqual(Ingestor.extension_of('quotes'), '')
+
+    def test_sniff_misnamed_files(self):
+        cases = [
+            (self.copy('SimpleLines.pdf', 'quotes.bin'), '.pdf'),
+            (self.copy('SimpleLines.docx', 'quotes.dat'), '.docx'),
+            (self.gzip('"Bark" - Rex\n', 'quotes.txt.bak'), '.txt.gz'),
+            (self.gzip('{"body": "Bark", "author": "Rex"}\n', 'quotes.bak'), '.jsonl.gz'),
+            (self.copy('SimpleLines.csv', 'quotes.old'), None),
+        ]
+        path = os.path.join(self.directory, 'quotes.json')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write('\n{"body": "Bark", "author": "Rex"}\n')
+        cases.append((path, '.jsonl'))
+        for path, extension in cases:
+            with self.subTest(path=path):
+                self.assertEqual(Ingestor.sniff(path), extension)
+        self.assertIsNone(Ingestor.sniff(os.path.join(self.directory, 'missing.bin')))
+
+    def test_misnamed_files_are_parsed(self):
+        for name, target in [('SimpleLines.pdf', 'quotes.bin'), ('SimpleLines.docx', 'quotes.dat')]:
+            with self.subTest(name=name):
+                quotes = Ingestor.parse(self.copy(name, target), strict=True)
+                self.assertEqual([quote.author for quote in quotes], [f"Author {i}" for i in range(1, 6)])
+        self.assertIsNone(Ingestor.ingestor_for(self.copy('SimpleLines.csv', 'quotes.bak')))
+
+
+class TestGzipAndJSONL(unittest.TestCase):
+    """The gzipped files are decompressed as they are read, and JSON Lines holds an object per line."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='ingestor-test-')
+        self.cache = Ingestor.cache
+        Ingestor.cache = None
+
+    def tearDown(self):
+        Ingestor.cache = self.cache
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write(self, name: str, content: str) -> str:
+        """Write a text file, gzipped when its name ends with .gz."""
+        path = os.path.join(self.directory, name)
+        opener = gzip.open if name.endswith('.gz') else open
+        with opener(path, 'wt', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def quotes(self, path: str) -> list:
+        return [(quote.quote_body, quote.author) for quote in Ingestor.iter_parse(path)]
+
+    def test_gzipped_files(self):
+        expected = [('Bark', 'Rex'), ('Bork', 'Fido')]
+        for name, content in [
+            ('quotes.txt.gz', "Bark - Rex\nBork - Fido\n"),
+            ('quotes.csv.gz', "body,author\nBark,Rex\nBork,Fido\n"),
+            ('quotes.jsonl.gz', '{"body": "Bark", "author": "Rex"}\n{"body": "Bork", "author": "Fido"}\n'),
+        ]:
+            with self.subTest(name=name):
+                self.assertEqual(self.quotes(self.write(name, content)), expected)
+
+    def test_gzipped_file_is_streamed(self):
+        lines = 20000
+        path = self.write('quotes.jsonl.gz', ''.join(f'{{"body": "Bark {i}", "author": "Rex"}}\n'
+                                                     for i in range(lines)))
+        quotes = Ingestor.iter_parse(path)
+        # the first quote is read before the rest of the file is decompressed
+        self.assertEqual(next(quotes).quote_body, 'Bark 0')
+        self.assertEqual(sum(1 for _ in quotes), lines - 1)
+
+    def test_jsonl(self):
+        path = self.write('quotes.jsonl', '{"body": "Bark", "author": "Rex"}\n\n  \n'
+                                          '{"author": "Fido", "body": "Bork"}')
+        self.assertEqual(self.quotes(path), [('Bark', 'Rex'), ('Bork', 'Fido')])
+
+    def test_jsonl_error_keeps_the_quotes_before(self):
+        path = self.write('quotes.jsonl', '{"body": "Bark", "author": "Rex"}\n{"body": "Bork"}\n')
+        quotes, error = Ingestor.collect(path)
+        self.assertEqual([quote.author for quote in quotes], ['Rex'])
+        self.assertIsInstance(error, KeyError)
+
+
+if __name__ == '__main__':
+    unittest.main()
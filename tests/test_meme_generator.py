@@ -0,0 +1,41 @@
+"""Test the variants of the MemeGenerator and their reuse from the render cache."""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from PIL import Image
+from meme_engine import meme_generator
+from meme_engine.meme_generator import MemeGenerator
+from meme_engine.render_cache import RenderCache
+
+
+class TestRenderVariants(unittest.TestCase):
+    """The variants are rendered once, and a cached meme is described without opening it."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='meme-generator-test-')
+        self.img_path = os.path.join(self.directory, 'image.jpg')
+        # an odd aspect ratio, so that the rounding of the heights matters
+        Image.new('RGB', (997, 613), 'green').save(self.img_path)
+        self.meme = MemeGenerator(os.path.join(self.directory, 'out'),
+                                  render_cache=RenderCache(os.path.join(self.directory, 'cache')))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_cache_hit_does_not_open_the_variants(self):
+        rendered = self.meme.render_variants(self.img_path, 'Bark', 'Rex')
+        for variant in rendered:
+            with Image.open(variant['path']) as img:
+                self.assertEqual(img.size, (variant['width'], variant['height']))
+
+        # the source image is read once per version, then a hit needs no Pillow at all
+        self.meme.render_variants(self.img_path, 'Bark', 'Rex')
+        with mock.patch.object(meme_generator.Image, 'open', side_effect=AssertionError('opened')):
+            cached = self.meme.render_variants(self.img_path, 'Bark', 'Rex')
+        self.assertEqual(cached, rendered)
+
+
+if __name__ == '__main__':
+    unittest.main()
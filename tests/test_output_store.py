@@ -0,0 +1,93 @@
+"""Test the OutputStore and its index shared by several processes."""
+import os
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+from PIL import Image
+from meme_engine.output_store import OutputStore
+
+# the limit on the number of memes of all the processes together
+MAX_FILES = 30
+
+
+def write_memes(root: str, index_path: str, count: int):
+    """Record count memes in a store of a separate process, enforcing the limits after each one."""
+    store = OutputStore(root, max_files=MAX_FILES, index_path=index_path)
+    for i in range(count):
+        path = store.path_for(f"{os.getpid()}-{i}.jpg")
+        with open(path, 'wb') as file:
+            file.write(b'\0' * 100)
+        store.add(path)
+        store.enforce()
+    store.stop()
+
+
+def meme_files(root: str) -> set:
+    """Return the memes on disk, relative to the root."""
+    return {os.path.relpath(os.path.join(directory, name), root)
+            for directory, _, names in os.walk(root) for name in names}
+
+
+class TestOutputStore(unittest.TestCase):
+    """The limits hold for the memes of all the processes, and the index matches the disk."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='output-store-test-')
+        self.root = os.path.join(self.directory, 'static')
+        self.index_path = os.path.join(self.directory, '.output_index')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_index_outside_root(self):
+        store = OutputStore(self.root, max_files=MAX_FILES, index_path=self.index_path)
+        store.save(Image.new('RGB', (4, 4)), 'a.jpg')
+        store.stop()
+        self.assertTrue(os.path.exists(self.index_path))
+        self.assertFalse(any(name.startswith('.output_index') for name in os.listdir(self.root)))
+
+    def test_processes_share_the_limits(self):
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=write_memes, args=(self.root, self.index_path, 50))
+                     for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+
+        store = OutputStore(self.root, max_files=MAX_FILES, index_path=self.index_path)
+        self.assertEqual(len(store), MAX_FILES)
+        self.assertEqual(meme_files(self.root), set(store._entries))
+        store.stop()
+
+    def test_compaction_by_another_process(self):
+        first = OutputStore(self.root, max_files=MAX_FILES, index_path=self.index_path)
+        second = OutputStore(self.root, max_files=MAX_FILES, index_path=self.index_path)
+        for i in range(40):
+            path = first.path_for(f"{i}.jpg")
+            with open(path, 'wb') as file:
+                file.write(b'\0' * 100)
+            (first if i % 2 else second).add(path)
+        self.assertEqual(first.enforce() + second.enforce(), 40 - MAX_FILES)
+        # the second store rewrites the index, the first one keeps appending to the new one
+        with second._exclusive():
+            second._sync()
+            second._compact()
+        path = first.path_for('late.jpg')
+        with open(path, 'wb') as file:
+            file.write(b'\0' * 100)
+        first.add(path)
+        first.stop()
+        second.stop()
+
+        store = OutputStore(self.root, max_files=MAX_FILES + 1, index_path=self.index_path)
+        self.assertEqual(set(store._entries), meme_files(self.root))
+        self.assertIn(os.path.join(os.path.dirname(os.path.relpath(path, self.root)), 'late.jpg'),
+                      store._entries)
+        store.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
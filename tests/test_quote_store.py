@@ -0,0 +1,60 @@
+"""Test the deduplication and the filtered sampling of the QuoteStore."""
+import random
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from quote_engine import QuoteModel
+from quote_engine.quote_store import QuoteStore
+
+
+class TestQuoteStore(unittest.TestCase):
+    """The duplicates are merged, and the filters only pick matching quotes."""
+
+    def test_duplicates_are_merged(self):
+        store = QuoteStore([QuoteModel('Bark at the moon', 'Rex'),
+                            QuoteModel('"bark  at the MOON"', 'rex'),
+                            QuoteModel('Bark at the moon', 'Fido')])
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.weight(0), 2.0)
+
+    def test_duplicates_are_found_after_growing(self):
+        quotes = [QuoteModel(f"Quote {i}", f"Pup {i % 7}") for i in range(1000)]
+        store = QuoteStore(quotes)
+        store.extend(quotes)
+        self.assertEqual(len(store), 1000)
+        self.assertEqual(store.weight(999), 2.0)
+        self.assertEqual(store[999].quote_body, 'Quote 999')
+
+    def test_sample_with_several_filters(self):
+        store = QuoteStore([QuoteModel('Bark and chase', 'Rex'),
+                            QuoteModel('Bark and nap', 'Rex'),
+                            QuoteModel('Bark and chase', 'Fido'),
+                            QuoteModel('Chase the ball', 'Rex')])
+        rng = random.Random(0)
+        for _ in range(20):
+            quote = store.sample(author='rex', query='bark chase', rng=rng)
+            self.assertEqual((quote.quote_body, quote.author), ('Bark and chase', 'Rex'))
+        self.assertEqual(len(store.search('bark chase')), 2)
+
+        # a new quote is seen by the filters sampled before
+        store.append(QuoteModel('Chase then bark', 'Rex'))
+        self.assertEqual(len(store.search('bark chase')), 3)
+        self.assertIsNone(store.sample(author='rex', query='bark ball'))
+
+    def test_concurrent_samples_beyond_the_cached_intersections(self):
+        words = [f"word{i}" for i in range(40)]
+        rng = random.Random(0)
+        store = QuoteStore([QuoteModel(' '.join(rng.sample(words, 10)), f"Pup {i % 5}") for i in range(2000)])
+        # far more distinct filters than the intersections kept, sampled from many threads
+        queries = [f"{a} {b}" for a in words for b in words if a < b]
+
+        def sample(offset):
+            for query in queries[offset::8]:
+                store.sample(author='pup 1', query=query)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for result in [executor.submit(sample, offset) for offset in range(8)]:
+                result.result()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+"""Test the RenderCache of the rendered memes."""
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from meme_engine.render_cache import RenderCache
+from meme_engine.output_store import OutputStore
+
+
+class TestRenderCache(unittest.TestCase):
+    """The cache keys the memes by their inputs, and bounds them by size and age."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='render-cache-test-')
+        self.cache_dir = os.path.join(self.directory, 'cache')
+        os.makedirs(self.cache_dir)
+        self.img_path = os.path.join(self.directory, 'image.jpg')
+        with open(self.img_path, 'wb') as file:
+            file.write(b'not decoded by the cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def key(self, text: str = 'Bark') -> str:
+        return RenderCache.make_key(self.img_path, text, 'Rex', 500, 'font.ttf', 40)
+
+    def put(self, cache: RenderCache, key: str, size: int = 100, suffix: str = None) -> str:
+        """Write a meme of the given size into the cache, like MemeGenerator does."""
+        with open(cache.path_for(key, suffix), 'wb') as file:
+            file.write(b'\0' * size)
+        cache.add(key, suffix)
+        return cache.path_for(key, suffix)
+
+    def test_hit_returns_the_same_path(self):
+        cache = RenderCache(self.cache_dir)
+        key = self.key()
+        self.assertIsNone(cache.get(key))
+        path = self.put(cache, key)
+        self.assertEqual(cache.get(key), path)
+        self.assertEqual(cache.get(key, '-150.webp'), None)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_eviction_past_max_bytes(self):
+        cache = RenderCache(self.cache_dir, max_bytes=250)
+        keys = [self.key(f"Bark {i}") for i in range(3)]
+        self.put(cache, keys[0])
+        self.put(cache, keys[1])
+        # the first meme is used again, so the second one is the least recently used
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.put(cache, keys[2])
+        self.assertEqual(cache.current_bytes, 200)
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertFalse(os.path.exists(cache.path_for(keys[1])))
+
+    def test_eviction_past_max_age(self):
+        cache = RenderCache(self.cache_dir, max_age=60)
+        key = self.key()
+        path = self.put(cache, key)
+        # the meme was last used two minutes ago
+        past = time.time() - 120
+        os.utime(path, (past, past))
+        self.assertIsNone(cache.get(key))
+        self.assertFalse(os.path.exists(path))
+
+    def test_reload_from_an_existing_directory(self):
+        cache = RenderCache(self.cache_dir)
+        keys = [self.key(f"Bark {i}") for i in range(3)]
+        for i, key in enumerate(keys):
+            path = self.put(cache, key)
+            os.utime(path, (1000 + i, 1000 + i))
+        # a file which does not belong to the cache is left alone
+        with open(os.path.join(self.cache_dir, 'other.jpg'), 'wb') as file:
+            file.write(b'\0' * 1000)
+
+        # the oldest meme is evicted when the directory is loaded again over a smaller quota
+        reloaded = RenderCache(self.cache_dir, max_bytes=250)
+        self.assertIsNone(reloaded.get(keys[0]))
+        self.assertIsNotNone(reloaded.get(keys[2]))
+        self.assertEqual(reloaded.current_bytes, 200)
+        self.assertTrue(os.path.exists(os.path.join(self.cache_dir, 'other.jpg')))
+
+    def test_memes_are_bounded_by_the_output_store(self):
+        store = OutputStore(self.cache_dir, max_files=2, index_path=os.path.join(self.directory, 'index'))
+        cache = RenderCache(store, max_bytes=None)
+        key = self.key()
+        # the variants of a meme share the shard of its key
+        path = self.put(cache, key)
+        variant = self.put(cache, key, suffix='-150.webp')
+        self.assertEqual(os.path.dirname(path), os.path.dirname(variant))
+        self.assertEqual(os.path.dirname(path), os.path.dirname(store.path_for(key)))
+        self.assertEqual((len(store), store.current_bytes), (2, 200))
+
+        # the janitor of the store deletes the oldest memes, which are then missed by the cache
+        other = self.key('Bork')
+        self.put(cache, other)
+        self.assertEqual(store.enforce(), 1)
+        self.assertIsNone(cache.get(key))
+        self.assertIsNotNone(cache.get(key, '-150.webp'))
+        self.assertIsNotNone(cache.get(other))
+
+    def test_eviction_is_recorded_in_the_output_store(self):
+        store = OutputStore(self.cache_dir, max_files=10, index_path=os.path.join(self.directory, 'index'))
+        cache = RenderCache(store, max_bytes=150)
+        first, second = self.key('Bark'), self.key('Bork')
+        self.put(cache, first)
+        self.put(cache, second)
+        self.assertEqual((len(store), store.current_bytes), (1, 100))
+        self.assertFalse(os.path.exists(cache.path_for(first)))
+
+    def test_source_mtime_changes_the_key(self):
+        key = self.key()
+        self.assertEqual(self.key(), key)
+        stat = os.stat(self.img_path)
+        os.utime(self.img_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        self.assertNotEqual(self.key(), key)
+
+
+if __name__ == '__main__':
+    unittest.main()
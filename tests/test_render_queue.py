@@ -0,0 +1,133 @@
+"""Test the RenderQueue and its SQLite store of the jobs."""
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from meme_engine.render_queue import (RenderQueue, RenderJob, SQLiteJobStore, QueueFullError,
+                                      QUEUED, RUNNING, DONE)
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    """Poll the condition until it holds or the timeout expires."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class TestRenderQueue(unittest.TestCase):
+    """Identical jobs are rendered once and a full queue refuses the new ones."""
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.calls = []
+        self.calls_lock = threading.Lock()
+
+    def tearDown(self):
+        # let the blocked workers go
+        self.release.set()
+
+    def render(self, body: str) -> str:
+        """Record the call and wait until the test releases the workers."""
+        with self.calls_lock:
+            self.calls.append(body)
+        self.release.wait(5)
+        return body.upper()
+
+    def test_identical_jobs_are_rendered_once(self):
+        render_queue = RenderQueue(self.render, max_workers=2)
+        first = render_queue.submit({'body': 'bark'})
+        self.assertEqual(render_queue.submit({'body': 'bark'}), first)
+        other = render_queue.submit({'body': 'bork'})
+        self.assertNotEqual(other, first)
+
+        self.release.set()
+        self.assertTrue(wait_for(lambda: render_queue.get(first).finished and render_queue.get(other).finished))
+        self.assertEqual(render_queue.get(first).to_dict()['result'], 'BARK')
+        self.assertEqual(sorted(self.calls), ['bark', 'bork'])
+
+        # once finished, the same params are a new job
+        self.assertNotEqual(render_queue.submit({'body': 'bark'}), first)
+
+    def test_full_queue_is_refused(self):
+        render_queue = RenderQueue(self.render, max_workers=1, max_pending=1)
+        running = render_queue.submit({'body': 'bark'})
+        # the only worker is busy with the first job, the second one waits in the queue
+        self.assertTrue(wait_for(lambda: self.calls == ['bark']))
+        render_queue.submit({'body': 'bork'})
+        with self.assertRaises(QueueFullError):
+            render_queue.submit({'body': 'woof'})
+        # an identical job joins the one in flight rather than being refused
+        self.assertEqual(render_queue.submit({'body': 'bark'}), running)
+
+
+class TestRenderQueueStore(unittest.TestCase):
+    """The unfinished jobs of the store are resumed, and rendered once by the queues sharing it."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='render-queue-test-')
+        self.store = SQLiteJobStore(os.path.join(self.directory, 'jobs.db'))
+        self.calls = []
+        self.calls_lock = threading.Lock()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def render(self, body: str) -> str:
+        with self.calls_lock:
+            self.calls.append(body)
+        time.sleep(0.01)
+        return body.upper()
+
+    def add_jobs(self, count: int) -> list:
+        """Store queued jobs, as left by a former run of the app."""
+        jobs = [RenderJob(f"job-{i}", RenderQueue.make_key({'body': f"bark {i}"}), {'body': f"bark {i}"})
+                for i in range(count)]
+        for job in jobs:
+            self.store.add(job)
+        return jobs
+
+    def finished(self, jobs: list) -> bool:
+        return all(self.store.load(job.id).status == DONE for job in jobs)
+
+    def test_resume_more_jobs_than_max_pending(self):
+        jobs = self.add_jobs(5)
+        started = time.monotonic()
+        render_queue = RenderQueue(self.render, max_workers=1, max_pending=2, store=self.store)
+        # the queue is created at once, the jobs are queued once the worker makes room
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertTrue(wait_for(lambda: self.finished(jobs)))
+        self.assertEqual(sorted(self.calls), sorted(job.params['body'] for job in jobs))
+        self.assertEqual(render_queue.get('job-4').result, 'BARK 4')
+
+    def test_queues_sharing_a_store_render_every_job_once(self):
+        jobs = self.add_jobs(20)
+        # like the processes of a WSGI server, every queue resumes the same jobs
+        for _ in range(3):
+            RenderQueue(self.render, max_workers=2, max_pending=4, store=self.store)
+        self.assertTrue(wait_for(lambda: self.finished(jobs)))
+        self.assertEqual(sorted(self.calls), sorted(job.params['body'] for job in jobs))
+
+    def test_claim(self):
+        job, = self.add_jobs(1)
+        self.assertTrue(self.store.claim(job))
+        self.assertFalse(self.store.claim(job))
+        self.assertEqual(self.store.load(job.id).status, RUNNING)
+        # a running job is only queued again once its claim expired
+        self.assertEqual(self.store.unfinished(lease=60), [])
+        self.assertEqual([job.status for job in self.store.unfinished(lease=0)], [QUEUED])
+
+    def test_submission_claimed_before_it_is_saved(self):
+        job = RenderJob('job', 'key', {'body': 'bark'})
+        self.assertTrue(self.store.claim(job))
+        # the submission saved late does not overwrite the state of the worker
+        self.store.add(job)
+        self.assertEqual(self.store.load(job.id).status, RUNNING)
+
+
+if __name__ == '__main__':
+    unittest.main()